@@ -0,0 +1,16 @@
+#设置CMAKE 最低支持的版本
+cmake_minimum_required(VERSION 3.20)
+
+#CMAKE 交叉编译配置
+SET(CMAKE_SYSTEM_NAME Generic)
+set(CMAKE_SYSTEM_PROCESSOR ARM)
+
+#汇总模式: 一次配置 编译项目中的所有工程 工具链只检测一次
+project({{project_name}} C ASM)
+
+#各工程生成的路径以项目根目录为根
+set(PRO_ROOT ${CMAKE_CURRENT_SOURCE_DIR})
+
+{{subdirectories}}
+#需要完全重新编译时手动执行: cmake --build build --target clean
+#需要丢弃 CMake 缓存重新配置时执行: cmake --fresh -S . -B build 并重新指定工具链等参数
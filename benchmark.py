@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+""" 转换流程的性能测试
+    使用 synthuvprojx 生成指定规模的工程 分别测量各个阶段的耗时和内存峰值:
+        startup    在没有工程的目录中运行 main.py 的总耗时 (解释器启动 导入模块 搜索目录) 子进程的内存不计入
+        discovery  目录搜索 (get_files_by_extensions)
+        parse      解析 uvprojx (UVPROJXProject 使用 --xml-backend 指定的解析后端)
+        generate   生成 .cmake (CMake.populateCMake)
+        output     生成 CMakeLists.txt 并写入磁盘 (CmakeCopyList + OutputStage.commit)
+    结果写为 JSON 便于在不同提交之间比较
+    @file
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from pathlib import Path
+
+import synthuvprojx
+from main import get_files_by_extensions
+import uvprojxproject
+from uvprojxproject import UVPROJXProject
+from outputstage import OutputStage
+import cmake
+
+def measure(stage, repeat):
+    """
+    测量一个阶段: 先不开启 tracemalloc 重复计时 再单独运行一次记录内存峰值
+    tracemalloc 会明显拖慢运行 因此不与计时混在一起
+
+    Args:
+        stage: 无参数的可调用对象
+        repeat: 计时的重复次数
+
+    Returns:
+        dict: {'seconds', 'min', 'median', 'peak_bytes'}
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': seconds, 'min': min(seconds), 'median': statistics.median(seconds), 'peak_bytes': peak}
+
+def git_commit():
+    """ 返回当前代码的提交号 不在 git 仓库中时返回 None """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def copy_tool(root):
+    """
+    将本工具复制到 <root>/ProjectToCMAKE main.py 以上一级目录作为项目根目录
+    """
+    tool_dir = Path(root)/'ProjectToCMAKE'
+    tool_dir.mkdir(parents=True)
+    source_dir = Path(__file__).parent
+    for pattern in ('*.py', '*.cmake'):
+        for file_path in source_dir.glob(pattern):
+            shutil.copy2(file_path, tool_dir/file_path.name)
+    return tool_dir
+
+def run(args):
+    """
+    生成合成工程并依次测量各个阶段
+
+    Returns:
+        dict: 测试结果
+    """
+    root = Path(tempfile.mkdtemp(prefix='uvprojx-bench-'))
+    empty_root = Path(tempfile.mkdtemp(prefix='uvprojx-bench-empty-'))
+    try:
+        main_py = copy_tool(empty_root)/'main.py'
+        #先运行一次生成 .pyc 计时只包括正常的启动
+        subprocess.run([sys.executable, str(main_py)], cwd=empty_root, capture_output=True, check=True)
+        uvprojx = synthuvprojx.create_tree(root, 'Synth', args.groups, args.files, args.incs,
+                                           args.defines, args.targets, not args.no_sources)
+
+        state = {}
+
+        def startup():
+            subprocess.run([sys.executable, str(main_py)], cwd=empty_root, capture_output=True, check=True)
+
+        def discovery():
+            state['files'] = get_files_by_extensions(root, ['uvprojx'])
+
+        def parse():
+            project = UVPROJXProject(str(uvprojx.parent), uvprojx, args.xml_backend)
+            project.parseProject()
+            state['project'] = project.getProject()
+
+        def generate():
+            generator = cmake.CMake(state['project'], root)
+            generator.AnalyseCmake()
+            generator.populateCMake()
+            state['generator'] = generator
+
+        def output():
+            stage = OutputStage()
+            stage.merge(state['generator'].output.items())
+            cmake.CMake(None, root, stage).CmakeCopyList(state['project'].name)
+            state['output_bytes'] = sum(len(data) for _, data in stage.items())
+            stage.commit()
+            #删除写入的文件 下一次运行需要重新写入
+            for file_path in stage.written:
+                os.remove(file_path)
+
+        stages = {}
+        for name, stage in (('startup', startup), ('discovery', discovery), ('parse', parse), ('generate', generate), ('output', output)):
+            #生成阶段的打印输出不计入结果
+            with open(os.devnull, 'w') as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    stages[name] = measure(stage, args.repeat)
+                finally:
+                    sys.stdout = stdout
+
+        return {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {
+                'groups': args.groups, 'files': args.files, 'incs': args.incs,
+                'defines': args.defines, 'targets': args.targets, 'repeat': args.repeat,
+                'xml_backend': uvprojxproject.load_backend(args.xml_backend)[0],
+                'uvprojx_bytes': os.path.getsize(uvprojx),
+                'output_bytes': state['output_bytes'],
+            },
+            'stages': stages,
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(empty_root, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the uvprojx to CMake conversion stages', add_help=True)
+    parser.add_argument('--groups', type=int, default=20, help="Number of source groups per target")
+    parser.add_argument('--files', type=int, default=200, help="Number of sources per group")
+    parser.add_argument('--incs', type=int, default=40, help="Number of include paths")
+    parser.add_argument('--defines', type=int, default=20, help="Number of defines")
+    parser.add_argument('--targets', type=int, default=1, help="Number of targets")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per stage")
+    parser.add_argument('--xml-backend', choices=uvprojxproject.XML_BACKENDS, default='auto',
+                        help="XML parser used by the parse stage")
+    parser.add_argument('--no-sources', action='store_true', help="Do not create source files on disk")
+    parser.add_argument('-o', '--output', default=None, help="JSON result file (default: print to stdout)")
+    args = parser.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+        for name, stage in result['stages'].items():
+            print(f"{name:10s} {stage['median'] * 1000:10.2f} ms  峰值内存 {stage['peak_bytes'] / 1024:10.1f} KB")
+    else:
+        print(text)
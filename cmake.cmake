@@ -5,13 +5,9 @@ cmake_minimum_required(VERSION 3.20)
 SET(CMAKE_SYSTEM_NAME Generic)
 set(CMAKE_SYSTEM_PROCESSOR ARM)
 
-# --- 警告：此操作会强制删除目录 ---
-# 在配置开始时，如果存在名为 "build" 的目录，则删除它
-if(EXISTS "${CMAKE_SOURCE_DIR}/build/")
-    message(STATUS "Removing old build directory...")
-    file(REMOVE_RECURSE "${CMAKE_SOURCE_DIR}/build/")
-endif()
-
+#构建目录在多次配置之间保留 只重新编译改变的文件
+#Rule.cmake 及其 include 的工程 .cmake 改变时 CMake 会自动重新配置
+#工程 .cmake 记录了来源的 uvprojx 及其哈希 uvprojx 的内容改变后配置时自动重新生成该工程
 include(cmake/Rule.cmake)
 # 当不是用ARM嵌入式工具链编译时，才设置版本属性
 if(NOT CMAKE_C_COMPILER_ID STREQUAL "GNU" OR NOT CMAKE_SYSTEM_NAME STREQUAL "Generic")
@@ -23,7 +19,7 @@ endif()
 
 
  # Set the project name 
-set(CMAKE_PROJECT_NAME CMAKE)
+set(CMAKE_PROJECT_NAME {{project_name}})
 
 project(${CMAKE_PROJECT_NAME} )
 
@@ -31,17 +27,6 @@ project(${CMAKE_PROJECT_NAME} )
  # Enable CMake support for ASM and C languages 
  enable_language(C ASM)
  
-#需要编译的.c文件
-SET(SRC_LIST
-    ${SRC_Pro}   
-)
-
-#编译时的头文件
-include_directories(${Inc_Pro})
-#编译成果物路径
-set(OUTPUT_PAHT ${OutPut_Path})
-set(EXECUTABLE_OUTPUT_PATH ${OUTPUT_PAHT})
-set(CMAKE_EXE_LINKER_FLAGS ${LINKER_FLAGS})
-add_executable(${CMAKE_PROJECT_NAME} ${SRC_LIST})
-#强制输出的成果物为 .elf
-set_target_properties(${PROJECT_NAME} PROPERTIES SUFFIX ".elf")
+{{targets}}
+#需要完全重新编译时手动执行: cmake --build build --target clean
+#需要丢弃 CMake 缓存重新配置时执行: cmake --fresh -S . -B build 并重新指定工具链等参数
@@ -1,66 +1,22 @@
 # -*- coding: utf-8 -*-
 
 import os
-from pathlib import Path
-import tempfile
+import io
+import re
+import json
+import fnmatch
+from pathlib import Path, PurePath
 import shutil
+import logging
+from outputstage import OutputStage
+from tracing import tracer
+from includescan import IncludeScanner
+import cmaketemplate
+import optimization
+from projectcache import hash_file
 
-def safe_create_file_structure(base_dir, file_name,file_cover = False, content="",indent=0):
-    """
-    安全创建文件夹和文件结构
-    
-    Args:
-        base_dir (str): 基础目录
-        folder_name (str): 文件夹名称
-        file_name (str): 文件名称
-        content (str): 文件内容
-    
-    Returns:
-        bool: 是否成功创建了文件（不包括已存在的情况）
-    """
-    if True:
-        # 转换为Path对象
-        folder_path = Path(base_dir)
-        file_path = folder_path / file_name
-        
-        print(f"目标路径: {file_path}")
-        
-        # 检查并创建文件夹
-        if not folder_path.exists():
-            print(f"创建文件夹: {folder_path}")
-            folder_path.mkdir(parents=True, exist_ok=True)
-        else:
-            print(f"文件夹已存在: {folder_path}")
-        
-        # 检查文件是否存在
-        if file_path.exists():
-            if file_cover:
-                print(f"文件已存在，进行覆盖操作: {file_path}")
-            else:
-                print(f"文件已存在，跳过创建 不覆盖: {file_path}")
-                return False
-            #return False
-        
+log = logging.getLogger(__name__)
 
-        # 创建文件
-        print(f"创建文件: {file_path}")
-        
-        # 处理不同操作系统的换行符
-        #if os.linesep != '\n':
-        #    content = content.replace('\n', os.linesep)
-        
-        # 写入文件        
-        file_path.write_text(content, encoding='utf-8')
-        
-        # 验证文件创建成功
-        if file_path.exists() and file_path.is_file():
-            file_size = file_path.stat().st_size
-            print(f"✓ 文件创建成功，大小: {file_size} 字节")
-            return True
-        else:
-            print("✗ 文件创建失败")
-            return False
-            
 def copy_file_with_custom_name(source_file, target_file):
     """
     跨平台复制文件到指定路径（可自定义文件名）
@@ -124,108 +80,78 @@ def process_relative_path(relative_path):
     
     return str(processed_path)
 
-def read_file_with_line_numbers(filename, encoding='utf-8'):
+def cmake_identifier(name):
     """
-    读取文件内容并按行分隔，返回带行号的内容列表
-    
-    参数:
-    filename: 文件名
-    encoding: 文件编码，默认为utf-8
-    
-    返回:
-    list: 包含行号和内容的元组列表 [(行号, 内容)]
+    将 Keil 的 Target 名称转换为可用作 CMake 目标名和变量名的标识符
+
+    Args:
+        name (str): Target 名称
+
+    Returns:
+        str: 只包含字母 数字和下划线的标识符
     """
-    try:
-        with open(filename, 'r', encoding=encoding) as file:
-            lines = file.readlines()
-        
-        # 返回带行号的内容列表（行号从1开始）
-        return [(i+1, line.rstrip('\n\r')) for i, line in enumerate(lines)]
-    
-    except FileNotFoundError:
-        print(f"错误：文件 '{filename}' 不存在")
-        return []
-    except Exception as e:
-        print(f"读取文件时发生错误：{e}")
-        return []
-def write_file_with_modifications(filename, modified_data, encoding='utf-8'):
+    return re.sub(r'[^A-Za-z0-9_]', '_', name) or '_'
+
+#生成源文件列表时保留的文件后缀
+SOURCE_SUFFIXES = ('.c', '.h', '.cpp')
+#参与合并编译的源文件后缀 以及每批合并的默认文件数
+UNITY_SUFFIXES = ('.c', '.cpp')
+UNITY_BATCH_SIZE = 8
+#需要编译的源文件后缀 及其编译器
+COMPILERS = {'.c': 'arm-none-eabi-gcc', '.cpp': 'arm-none-eabi-g++'}
+#通用的编译选项和链接选项 (内核选项 -mcpu 除外) 生成 .cmake 和 build.ninja 时共用
+C_FLAGS = ('-mthumb', '-Wall', '-fdata-sections', '-ffunction-sections')
+#CMAKE_C_FLAGS_INIT 使用的选项 会出现在每条编译命令中 因此不能包含只用于链接的选项
+INIT_FLAGS = ('--specs=nano.specs', '--specs=nosys.specs', '-mfloat-abi=soft', '-mthumb')
+#armlink 默认删除未使用的段 链接时总是使用 --gc-sections
+LINK_FLAGS = INIT_FLAGS + ('-Wl,--gc-sections',)
+
+def cmake_relative_path(relative_path):
     """
-    将修改后的数据写入文件（跨平台兼容）
-    
-    参数:
-    filename: 文件名
-    modified_data: 修改后的数据，可以是字符串列表或带行号的元组列表
-    encoding: 文件编码，默认为utf-8
-    
-    返回:
-    bool: 操作是否成功
+    process_relative_path 的快速版本 直接返回POSIX格式的字符串
+    去除开头的所有 "../" 只在必要时才创建 Path 对象
+
+    Args:
+        relative_path: 输入相对路径 (str 或 Path)
+
+    Returns:
+        str: 处理后的POSIX格式路径
     """
-    try:
-        # 处理不同格式的输入数据
-        if modified_data and isinstance(modified_data[0], tuple):
-            # 如果是带行号的元组列表，提取内容部分
-            lines = [line for _, line in modified_data]
-        else:
-            lines = modified_data
-        
-        # 使用临时文件确保写入安全
-        with tempfile.NamedTemporaryFile(
-            mode='w', 
-            encoding=encoding, 
-            delete=False,
-            newline=''  # 使用系统默认换行符
-        ) as temp_file:
-            
-            # 写入数据，使用系统默认换行符
-            for line in lines:
-                temp_file.write(line + '\n')
-        
-        # 用临时文件替换原文件
-        shutil.move(temp_file.name, filename)
-        
-        print(f"成功写入文件: {filename}")
-        return True
-    except Exception as e:
-        print(f"写入文件时发生错误：{e}")
-        # 清理临时文件
-        if 'temp_file' in locals() and os.path.exists(temp_file.name):
-            os.unlink(temp_file.name)
-        return False
-    
-def are_first_n_chars_equal(str1, str2, n):
+    if not isinstance(relative_path, PurePath):
+        relative_path = Path(relative_path)
+    parts = relative_path.parts
+    i = 0
+    while i < len(parts) and parts[i] == "..":
+        i += 1
+    if i == len(parts):
+        return "."
+    if i == 0 and relative_path.anchor:
+        return relative_path.as_posix()
+    return '/'.join(parts[i:])
+
+def cmake_arg(arg):
     """
-    判断两个字符串的前n个字符是否相同
-    
-    参数:
-    str1: 第一个字符串
-    str2: 第二个字符串
-    n: 要比较的字符数量
-    
-    返回:
-    bool: 如果前n个字符相同返回True，否则返回False
+    为 CMake 命令参数加上双引号 (参数包含空格 分号等字符时)
     """
-    # 处理边界情况
-    if n < 0:
-        raise ValueError("n不能为负数")
-    
-    # 如果n为0，总是返回True（比较0个字符）
-    if n == 0:
-        return True
-    
-    # 如果任一字符串长度小于n，无法比较
-    if len(str1) < n or len(str2) < n:
-        return False
-    
-    # 比较前n个字符
-    return str1[:n] == str2[:n]
+    if any(c in ' \t;"()#' for c in arg):
+        arg = '"' + arg.replace('\\', '/').replace('"', '\\"') + '"'
+    return arg
 
 class CMake (object):
     
-    def __init__(self, project, path):
+    def __init__(self, project, path, output=None, args=None, root_var=None):
         
         self.path = path
+        #生成的路径以该 CMake 变量为根 (项目根目录) 汇总模式 (--aggregate) 下为顶层 CMakeLists.txt 设置的 PRO_ROOT
+        if root_var is None:
+            root_var = 'PRO_ROOT' if getattr(args, 'aggregate', False) else 'CMAKE_CURRENT_SOURCE_DIR'
+        self.root_var = '${' + root_var + '}'
+        self.root = self.root_var + '/'
         self.project = project
-        self.context = {}
+        #命令行参数 控制 unity build 等可选的生成方式
+        self.args = args
+        #生成的文件先暂存 由调用者统一提交
+        self.output = output if output is not None else OutputStage()
         self.Cmake = {}
         #print(self.path)
     
@@ -236,165 +162,757 @@ class CMake (object):
         :param self: 解析生成对应工程的.CMAKE文件 或生成对应的.CMAKE文件 
         """
         cmake_file = self.path
-        cmake_file_name = self.project['name'].text + ".cmake"
+        cmake_file_name = self.project.name + ".cmake"
         #safe_create_file_structure(cmake_file, "cmake", cmake_file_name)
         #此处应该读取 手动配置的 CMAKE编译选项
         self.Cmake['CMAKE_C_FLAGS_MANUAL']= ''
-        self.Cmake['CMAKE_LINKER_FILE'] = ''
-        self.Cmake['CMAKE_SRC_INIT']=''
+        #按器件型号查找 GCC 启动文件和链接脚本 未找到时保持为空 需要手动配置
+        startup, linker = self.findDeviceFiles()
+        self.Cmake['CMAKE_LINKER_FILE'] = self.sourcePath(linker) if linker else ''
+        self.Cmake['CMAKE_SRC_INIT'] = self.sourcePath(startup) if startup else ''
+        #扫描 #include 依赖 选择预编译头文件
+        self.Cmake['PCH'] = []
+        if getattr(self.args, 'pch', False):
+            with tracer.span('pch scan'):
+                self.Cmake['PCH'] = self.findPrecompiledHeaders()
+        #删除未使用的头文件路径 并按命中次数排序
+        self.Cmake['INCS'] = {}
+        if getattr(self.args, 'prune_incs', False):
+            with tracer.span('prune incs'):
+                self.Cmake['INCS'] = self.pruneIncludePaths()
+
+    def findDeviceFiles (self):
+        """
+        在器件索引 (见 devicepack.py 由 main.py 建立) 中查找第一个 Target 的器件对应的启动文件和链接脚本
+
+        Returns:
+            tuple: (startup, linker) 磁盘上的路径 未找到时为 None
+        """
+        index = getattr(self.args, 'device_index', None)
+        if index is None:
+            return None, None
+        device = self.project.main.chip
+        #工程使用的目录 离这些目录最近的文件优先
+        paths = self.project.paths
+        source_dir = self.sourceDir()
+        near = {str(source_dir)}
+        near.update(os.path.normpath(source_dir/paths.path(i)) for i in self.project.main.incs)
+        near.update(os.path.dirname(os.path.normpath(source_dir/paths.path(i))) for group in self.project.main.groups for i in group.files)
+        startup, linker = index.lookup(device, near)
+        for name, found in (('启动文件', startup), ('链接脚本', linker)):
+            if found:
+                log.info("器件 %s 使用%s: %s", device, name, found)
+            else:
+                log.warning("⚠ 未找到器件 %s 的%s 需要手动配置", device, name)
+        return startup, linker
+
+    def includeScanner (self, incs=None):
+        """
+        创建 #include 扫描器 默认使用第一个 Target 的头文件路径 #include 列表缓存在 cmake/.cache/index 中
+        (不放在 cmake/.cache 中 避免被当作解析缓存的条目淘汰)
+
+        :param incs: 头文件路径在路径表中的序号列表
+        """
+        cache_file = None
+        if not getattr(self.args, 'no_cache', False):
+            cache_file = Path(self.path)/"cmake"/".cache"/"index"/"includes.pickle"
+        if incs is None:
+            incs = self.project.main.incs
+        return IncludeScanner(self.sourceDir(), [self.project.paths.path(i) for i in incs], cache_file)
+
+    def sourceDir (self):
+        """
+        返回 uvprojx 文件所在目录 工程中的相对路径都相对于该目录
+        """
+        return Path(self.project.uvprojx).parent
+
+    def sourcePath (self, file):
+        """
+        将磁盘上的绝对路径转换为 .cmake 中使用的路径 与 inc/src 的格式相同
+        不在项目目录中的文件 (如单独安装的器件包) 使用绝对路径
+        """
+        try:
+            relative = Path(file).absolute().relative_to(Path(self.path).absolute())
+        except ValueError:
+            return Path(file).absolute().as_posix()
+        return self.root + relative.as_posix()
+
+    def localPath (self, cmake_path):
+        """
+        将 .cmake 中使用的路径转换为相对于项目根目录的路径 (绝对路径保持不变)
+        """
+        return cmake_path[len(self.root):] if cmake_path.startswith(self.root) else cmake_path
+
+    def includePaths (self, target):
+        """
+        返回 target 生成时使用的头文件路径 (路径表序号) 开启 --prune-incs 时为分析后的结果
+        """
+        return self.Cmake.get('INCS', {}).get(tuple(target.incs), target.incs)
+
+    def pruneIncludePaths (self):
+        """
+        分析每组头文件路径实际被源文件使用的情况 (头文件路径相同的 Target 一起分析)
+        删除未使用的路径 其余按命中次数排序 并报告删除的路径和同名头文件的遮蔽情况
+
+        Returns:
+            dict: 原头文件路径 (路径表序号 tuple) -> 新的头文件路径序号列表
+        """
+        paths = self.project.paths
+        sources = {}
+        for target in self.project.targets:
+            sources.setdefault(tuple(target.incs), []).extend(target.srcs)
+
+        result = {}
+        for incs, srcs in sources.items():
+            scanner = self.includeScanner(incs)
+            order, removed, shadowed = scanner.includeOrder([paths.path(i) for i in dict.fromkeys(srcs)])
+            for i in removed:
+                log.info("删除未使用的头文件路径: %s", paths.path(incs[i]))
+            for name, matches in shadowed:
+                log.warning("⚠ 同名头文件 %s 存在于多个路径中 保持其原有顺序: %s",
+                            name, ', '.join(paths.path(incs[i]) for i in matches))
+            for i in order:
+                log.debug("头文件路径 %s 命中 %d 次", paths.path(incs[i]), scanner.hits[i])
+            result[incs] = [incs[i] for i in order]
+        return result
+
+    def findPrecompiledHeaders (self):
+        """
+        扫描所有 Target 的源文件 返回被大多数编译单元包含的头文件
+        """
+        sources = {}
+        for target in self.project.targets:
+            sources.update(dict.fromkeys(target.srcs))
+        sources = [self.project.paths.path(i) for i in sources]
+        scanner = self.includeScanner()
+        headers = scanner.precompiledHeaders(sources, getattr(self.args, 'pch_max', 3),
+                                             getattr(self.args, 'pch_threshold', 0.5))
+        for header in headers:
+            log.info("预编译头文件: %s", header)
+        return [self.sourcePath(header) for header in headers]
 
     def populateCMake (self):
         """ Generate CMakeList.txt file for building the project
         """
 
         # For debug run cmake -DCMAKE_BUILD_TYPE=Debug or Release
-        cmake = {}
+        self.core = self.coreFlag()
+        log.info("当前生成项目使用的 处理器内核为：%s", self.core)
+
+        #abspath = os.path.abspath(os.path.join(self.path,'CMakeLists.txt'))
+        self.generateFile()
+        #
+
+        #print ('Created file CMakeLists.txt [{}]'.format(abspath))
+
+    def coreFlag (self, target=None):
+        """
+        返回 target (默认为第一个 Target) 的内核选项 如 -mcpu=cortex-m3
+        """
+        target = target or self.project.main
+        return '-mcpu=' + target.ads_cpu_type.strip('"\'').lower()
+
+    def compileFlags (self, target):
+        """
+        返回编译 target 的源文件时使用的选项列表 (不含宏定义和头文件路径) 与生成的 .cmake 一致
+        """
+        return [self.coreFlag(target)] + self.Cmake['CMAKE_C_FLAGS_MANUAL'].split() + list(C_FLAGS)
+
+    def optimizeFlags (self, target, build_type='Release'):
+        """
+        返回 target 在 build_type 下的优化选项列表 由 Keil 的优化设置转换 (见 optimization.py)
+        """
+        flags = optimization.build_type_flags(target.options, getattr(self.args, 'lto', 'auto'))
+        return flags[build_type][0].split()
+
+    def overrideOptions (self, options, override):
+        """
+        返回 Keil 分组/文件设置 (GroupOption/FileOption) 增加的编译选项列表
+        明确设置的优化等级在所有编译类型中生效 取消的宏定义使用 -U (在 -D 之后)
+
+        :param options: 上一级 (Target 或分组) 的优化设置
+        :param override: projectmodel.Override 或 None
+        """
+        if override is None:
+            return []
+        flags = []
+        if override.options:
+            flags.append(optimization.optimize_level(dict(options, **override.options)))
+        return flags + ['-U' + define for define in override.undefs]
+
+    def linkFlags (self, build_type='Release'):
+        """
+        返回链接时使用的选项列表 与生成的 .cmake 一致 未设置链接文件时不加 -T
+        """
+        linker_file = self.Cmake['CMAKE_LINKER_FILE']
+        flags = optimization.build_type_flags(self.project.main.options, getattr(self.args, 'lto', 'auto'))
+        return (['-T' + self.localPath(linker_file)] if linker_file else []) + list(LINK_FLAGS) + flags[build_type][1].split()
+
+    def uvprojxPath (self):
+        """
+        返回 uvprojx 文件相对于项目根目录的路径 (POSIX 格式) 项目外的文件返回绝对路径
+        """
+        uvprojx = Path(self.project.uvprojx)
+        try:
+            return uvprojx.relative_to(self.path).as_posix()
+        except ValueError:
+            return uvprojx.as_posix()
+
+    def converterPath (self):
+        """
+        返回 main.py 相对于项目根目录的路径 (POSIX 格式)
+        """
+        main = Path(__file__).parent/"main.py"
+        try:
+            return main.relative_to(self.path).as_posix()
+        except ValueError:
+            return main.as_posix()
+
+    def regenArgs (self):
+        """
+        重新生成本工程时传给 main.py 的参数 只包含影响生成结果的选项 不包括 --only
+        """
+        args = self.args
+        result = []
+        for name in ('aggregate', 'ninja', 'unity', 'pch', 'prune_incs', 'group_libs'):
+            if getattr(args, name, False):
+                result.append('--' + name.replace('_', '-'))
+        if not getattr(args, 'compile_commands', True):
+            result.append('--no-compile-commands')
+        if not getattr(args, 'device_pack', True):
+            result.append('--no-device-pack')
+        if getattr(args, 'unity', False) and getattr(args, 'unity_batch', None) is not None:
+            result.append('--unity-batch=' + str(args.unity_batch))
+        for pattern in getattr(args, 'unity_exclude', None) or []:
+            result.append('--unity-exclude=' + pattern)
+        if getattr(args, 'pch', False):
+            result += ['--pch-max=' + str(args.pch_max), '--pch-threshold=' + str(args.pch_threshold)]
+        for pack_root in getattr(args, 'pack_root', None) or []:
+            result.append('--pack-root=' + Path(pack_root).absolute().as_posix())
+        #跳过的目录也影响器件索引 (启动文件和链接脚本的查找)
+        for pattern in getattr(args, 'exclude', None) or []:
+            result.append('--exclude=' + pattern)
+        for name in ('lto', 'xml_backend'):
+            if getattr(args, name, 'auto') != 'auto':
+                result.append('--' + name.replace('_', '-') + '=' + getattr(args, name))
+        return result
+
+    def iterRegenerate (self):
+        """
+        产出配置时重新生成本工程的设置
+        uvprojx 作为配置依赖 修改后 CMake 自动重新配置 内容的哈希与生成时不同才运行 main.py --only 只转换本工程
+        重新生成后读取新的 .cmake 并跳过本文件剩余的内容 正常编译不需要额外的操作
+        """
+        uvprojx = self.uvprojxPath()
+        if not PurePath(uvprojx).is_absolute():
+            uvprojx = self.root + uvprojx
+        try:
+            digest = hash_file(self.project.uvprojx)
+        except OSError:
+            return
+        command = ['${Python3_EXECUTABLE}', self.root + self.converterPath(), '--only', '${PRO_UVPROJX}'] + self.regenArgs()
+
+        yield '\n #工程改变后重新生成 (uvprojx 的内容与生成时不同时 只重新转换本工程)\n'
+        yield ' set(PRO_UVPROJX ' + cmake_arg(uvprojx) + ')\n'
+        yield ' set_property(DIRECTORY APPEND PROPERTY CMAKE_CONFIGURE_DEPENDS ${PRO_UVPROJX})\n'
+        yield ' file(SHA256 ${PRO_UVPROJX} PRO_UVPROJX_HASH)\n'
+        yield ' if(NOT PRO_UVPROJX_HASH STREQUAL "' + digest + '" AND NOT PRO_REGENERATED)\n'
+        yield '   find_package(Python3 COMPONENTS Interpreter QUIET)\n'
+        yield '   if(Python3_FOUND)\n'
+        yield '     message(STATUS "Regenerating from ${PRO_UVPROJX}")\n'
+        yield '     execute_process(COMMAND ' + ' '.join(cmake_arg(arg) for arg in command) + '\n'
+        yield '                     WORKING_DIRECTORY ' + self.root_var + ' RESULT_VARIABLE PRO_REGEN_RESULT)\n'
+        yield '     if(PRO_REGEN_RESULT EQUAL 0)\n'
+        yield '       set(PRO_REGENERATED ON)\n'
+        yield '       include(${CMAKE_CURRENT_LIST_FILE})\n'
+        yield '       unset(PRO_REGENERATED)\n'
+        yield '       return()\n'
+        yield '     endif()\n'
+        yield '     message(WARNING "Regenerating from ${PRO_UVPROJX} failed, using the previous settings")\n'
+        yield '   else()\n'
+        yield '     message(WARNING "${PRO_UVPROJX} changed but Python 3 was not found, run ' + self.converterPath() + ' again")\n'
+        yield '   endif()\n'
+        yield ' endif()\n'
+
+    def iterCompileCommands (self):
+        """
+        逐条产出 compile_commands.json 的条目 (JSON 字符串) 编译选项 宏定义和头文件路径与生成的 .cmake 相同
+        多个 Target 包含同一个源文件时只产出第一个 Target 的条目
+        """
+        root = Path(self.path).absolute()
+        directory = root.as_posix()
+        paths = self.project.paths
+        group_libs = getattr(self.args, 'group_libs', False)
+
+        def overrideFlags(options, override):
+            #分组/文件设置 只在 --group-libs 时生成到 .cmake 中
+            if not group_libs or override is None:
+                return []
+            return ['-D' + define for define in override.defs] + \
+                   ['-I' + (root/paths.cmakePath(inc)).as_posix() for inc in override.incs] + \
+                   self.overrideOptions(options, override)
+
+        seen = set()
+        for target in self.project.targets:
+            flags = self.compileFlags(target) + self.optimizeFlags(target) + ['-D' + define for define in target.defs]
+            flags += ['-I' + (root/paths.cmakePath(inc)).as_posix() for inc in self.includePaths(target)]
+            for group in target.groups:
+                group_flags = flags + overrideFlags(target.options, group.override)
+                group_options = dict(target.options, **group.override.options) if group.override else target.options
+                for file in group.files:
+                    src_file = paths.cmakePath(file)
+                    compiler = COMPILERS.get(PurePath(src_file).suffix)
+                    if compiler is None or file in seen:
+                        continue
+                    seen.add(file)
+                    src_file = (root/src_file).as_posix()
+                    arguments = [compiler] + group_flags + overrideFlags(group_options, group.file_overrides.get(file))
+                    yield json.dumps({'directory': directory, 'file': src_file,
+                                      'arguments': arguments + ['-c', src_file]}, ensure_ascii=False)
+
+    def iterCMake (self):
+        """
+        逐段产出 <name>.cmake 的内容 各段之间以换行和一个空格分隔
+        按顺序写出即可得到完整文件 不需要先拼接成一个大字符串
+        """
         #fpu = '-mfpu=fpv5-sp-d16 -mfloat-abi=softfp'
         fpu = ''
-        core =  self.project['AdsCpuType'].strip('"\'')
-        core = '-mcpu='+core.lower()
-        print("当前生成项目使用的 处理器内核为："+core)
+        core = self.core
 
-        cmake['version'] = 'cmake_minimum_required(VERSION 3.20)'
-        #cmake['language'] =  '# Enable CMake support for ASM and C languages \n enable_language(C ASM)'
-        cmake['CMAKE_SYSTEM'] = 'set(CMAKE_SYSTEM_NAME Generic)\n set(CMAKE_SYSTEM_PROCESSOR arm)\n'
-        cmake['project'] = '# Set the project name \n set(CMAKE_PROJECT_NAME '+self.project['name'] +')\n'
+        yield ' cmake_minimum_required(VERSION 3.20)'
+        yield from self.iterRegenerate()
+        #yield '\n # Enable CMake support for ASM and C languages \n enable_language(C ASM)'
+        yield '\n set(CMAKE_SYSTEM_NAME Generic)\n set(CMAKE_SYSTEM_PROCESSOR arm)\n'
+        yield '\n # Set the project name \n set(CMAKE_PROJECT_NAME '+self.project.name +')\n'
 
         #配置手动添加的编译选项
-        cmake['CMAKE_C_FLAGS_MANUAL'] = '\n\n# This time, new compilation options have been added.\n #此处应该读取 手动配置的 CMAKE编译选项\n set(CMAKE_C_FLAGS_MANUAL '+self.Cmake['CMAKE_C_FLAGS_MANUAL']+')'
+        yield '\n \n\n# This time, new compilation options have been added.\n #此处应该读取 手动配置的 CMAKE编译选项\n set(CMAKE_C_FLAGS_MANUAL '+self.Cmake['CMAKE_C_FLAGS_MANUAL']+')'
         #手动配置对应的链接文件 末尾以 .ld结尾 STM32的可以使用CudeMX生成，添加文件路径格式 应该类似与 下面的 inc与src
-        cmake['CMAKE_LINKER_FILE'] = '#手动配置对应的链接文件 末尾以 .ld结尾 STM32的可以使用CudeMX生成,添加文件路径格式 应该类似与 下面的 inc与src\n #示例： ${CMAKE_CURRENT_SOURCE_DIR}/Drivers/CMSIS/Device/ST/STM32F1xx/STM32F103XX_FLASH.ld)\n' \
+        yield '\n #手动配置对应的链接文件 末尾以 .ld结尾 STM32的可以使用CudeMX生成,添加文件路径格式 应该类似与 下面的 inc与src\n #示例： ${CMAKE_CURRENT_SOURCE_DIR}/Drivers/CMSIS/Device/ST/STM32F1xx/STM32F103XX_FLASH.ld)\n' \
         'set(CMAKE_LINKER_FILE '+self.Cmake['CMAKE_LINKER_FILE']+')'
         #手动配置启动文件 asm文件 引导设备启动
-        cmake['CMAKE_SRC_INIT']= '#手动配置启动文件 末尾以 .s/.S 结尾 STM32的可以使用CudeMX生成,添加文件路径格式 应该类似与 下面的 inc与src \n #示例：${CMAKE_CURRENT_SOURCE_DIR}/Drivers/CMSIS/Device/ST/STM32F1xx/Source/Templates/gcc/startup_stm32f103xb.s\n ' \
-        'set(CMAKE_LINKER_FILE '+self.Cmake['CMAKE_SRC_INIT']+')'
+        yield '\n #手动配置启动文件 末尾以 .s/.S 结尾 STM32的可以使用CudeMX生成,添加文件路径格式 应该类似与 下面的 inc与src \n #示例：${CMAKE_CURRENT_SOURCE_DIR}/Drivers/CMSIS/Device/ST/STM32F1xx/Source/Templates/gcc/startup_stm32f103xb.s\n ' \
+        'set(CMAKE_SRC_INIT '+self.Cmake['CMAKE_SRC_INIT']+')'
         #手动配置gcc编译时的路径
 
-        cmake['CMAKE_COMPILER_PATH'] = ' if(CMAKE_C_COMPILER)\n   message(STATUS "CMAKE_C_COMPILER: ${CMAKE_C_COMPILER}")\n    get_filename_component(ABS_CONFIG_DIR "${CMAKE_C_COMPILER}" DIRECTORY ABSOLUTE)\n'\
+        yield '\n  if(CMAKE_C_COMPILER)\n   message(STATUS "CMAKE_C_COMPILER: ${CMAKE_C_COMPILER}")\n    get_filename_component(ABS_CONFIG_DIR "${CMAKE_C_COMPILER}" DIRECTORY ABSOLUTE)\n'\
         '   message(STATUS "ABS_CONFIG_DIR: ${ABS_CONFIG_DIR}")\n    set(TOOLCHAIN_PREFIX ${ABS_CONFIG_DIR}/arm-none-eabi-)\n    message(STATUS "TOOLCHAIN_PREFIX: ${TOOLCHAIN_PREFIX}")\n'\
         '   set(CMAKE_CXX_COMPILER ${TOOLCHAIN_PREFIX}g++.exe)\n endif()\n    set(CMAKE_ASM_COMPILER  ${CMAKE_C_COMPILER})\n    set(CMAKE_LINKER        ${CMAKE_CXX_COMPILER})\n'\
         '   set(CMAKE_OBJCOPY       ${TOOLCHAIN_PREFIX}objcopy.exe)\n    set(CMAKE_SIZE          ${TOOLCHAIN_PREFIX}size.exe)'
-        #cmake['CMAKE_COMPILER_PATH'] = '# arm-none-eabi- must be part of path environment\n #手动配置启动文件 可以网上找教程 安装GCC编译工具链 并找到安装路径 举例: '\
-        ' E:/gcc/10_2021.10/bin/arm-none-eabi- \nset(TOOLCHAIN_PREFIX   )\n '
+        #yield '# arm-none-eabi- must be part of path environment\n #手动配置启动文件 可以网上找教程 安装GCC编译工具链 并找到安装路径 举例: '\
+        #' E:/gcc/10_2021.10/bin/arm-none-eabi- \nset(TOOLCHAIN_PREFIX   )\n '
 
-        #加载编译器 arm
-        #cmake['CMAKE_COMPILER'] = '\n\n set(CMAKE_C_COMPILER    ${TOOLCHAIN_PREFIX}gcc.exe)\n set(CMAKE_ASM_COMPILER ${CMAKE_C_COMPILER})\n set(CMAKE_CXX_COMPILER  ${TOOLCHAIN_PREFIX}gcc.exe) \n' 
-        #cmake['CMAKE_COMPILER'] = cmake['CMAKE_COMPILER'] +'set(CMAKE_LINKER    ${TOOLCHAIN_PREFIX}gcc.exe)\n set(CMAKE_OBJCOPY ${TOOLCHAIN_PREFIX}objcopy.exe)\n set(CMAKE_SIZE    ${TOOLCHAIN_PREFIX}size.exe)\n'
         #配置内核型号
-        cmake['CpuType'] =' # MCU specific flags\n set(TARGET_FLAGS "' + core +'")\n'
+        yield '\n  # MCU specific flags\n set(TARGET_FLAGS "' + core +'")\n'
         #配置配置通用的编译选项 等
-        cmake['CMAKE_C_FLAGS'] = '# 此处是通用的编译选项C语言 自动生成\n set(CMAKE_C_FLAGS "${CMAKE_C_FLAGS} ${TARGET_FLAGS} ${CMAKE_C_FLAGS_MANUAL} -mthumb' \
-        ' -Wall -fdata-sections -ffunction-sections ")'
-        cmake['CMAKE_ASM_FLAGS'] = '# 此处是通用的编译选项汇编语言 自动生成\n set(CMAKE_ASM_FLAGS "${TARGET_FLAGS} -x -mthumb assembler-with-cpp -MMD -MP")'
-        cmake['CMAKE_CXX_FLAGS']='# 此处是通用的编译选项CXX语言 自动生成\n set(CMAKE_CXX_FLAGS "${CMAKE_C_FLAGS} -Wall -fdata-sections -ffunction-sections")\n\n'
-        cmake['CMAKE_C_FLAGS_INIT']='set(CMAKE_C_FLAGS_INIT "--specs=nano.specs --specs=nosys.specs -mfloat-abi=soft -mthumb")\n'
-        #配置宏定义
-        cmake['defines'] = '#此处是项目使用的宏定义 自动生成\nadd_compile_definitions( \n'
-        for define in self.project['defs']:
-            cmake['defines']=cmake['defines']+'  '+define+'\n'
-        cmake['defines']=cmake['defines'] + ')\n'
+        yield '\n # 此处是通用的编译选项C语言 自动生成\n set(CMAKE_C_FLAGS "${CMAKE_C_FLAGS} ${TARGET_FLAGS} ${CMAKE_C_FLAGS_MANUAL} ' \
+        + ' '.join(C_FLAGS) + ' ")'
+        yield '\n # 此处是通用的编译选项汇编语言 自动生成\n set(CMAKE_ASM_FLAGS "${TARGET_FLAGS} -x assembler-with-cpp -mthumb -MMD -MP")'
+        yield '\n # 此处是通用的编译选项CXX语言 自动生成\n set(CMAKE_CXX_FLAGS "${CMAKE_C_FLAGS} -Wall -fdata-sections -ffunction-sections")\n\n'
+        yield from self.iterReproducible()
+        yield from self.iterOptimization()
+        yield '\n set(CMAKE_C_FLAGS_INIT "' + ' '.join(INIT_FLAGS) + '")\n'
+        #配置宏定义 多个 Target 时这里只包含所有 Target 共有的宏定义
+        yield '\n #此处是项目使用的宏定义 自动生成\nadd_compile_definitions( \n'
+        for define in self.commonDefines():
+            yield '  '+define+'\n'
+        yield ')\n'
         #配置连接文件output
-        cmake['Link_Flags']='\n set(LINKER_FLAGS "-T${CMAKE_LINKER_FILE} --specs=nano.specs --specs=nosys.specs -mfloat-abi=soft -mthumb")'
-        #配置成果物路径
-        rlaease_path = Path(self.path/"release")
-        path_obj = Path(rlaease_path)
-        # 转换为字符串时会使用当前系统的分隔符，可以强制转换为POSIX格式
-        posix_path = path_obj.as_posix()
-        cmake['output'] = '#此处是项目的成果物输出路径 默认默认生成在父目录下/release/project_name中 如果需要修改 请在cmake.py中进行\nSET(OutPut_Path '+str(posix_path)+')\n'
-
-        cmake['incs'] = '#generated include paths \n set(Inc_Pro \n'
-        for inc in self.project['incs']:    
-            inc_file = process_relative_path(inc)
-            path_obj = Path(inc_file)
-            # 转换为字符串时会使用当前系统的分隔符，可以强制转换为POSIX格式
-            posix_path = path_obj.as_posix()
-            cmake['incs'] = cmake['incs'] + '   ${CMAKE_CURRENT_SOURCE_DIR}/'+ posix_path + '\n'
-            #cmake['incs'].append(inc_file)    
-            #print(inc_file)
-        cmake['incs'] = cmake['incs'] +  ')' + '\n'
-        cmake['srcs'] = '#generated src paths \n set(SRC_Pro \n'
-
-
-
-        for file in self.project['srcs']:
-            src_file = process_relative_path(file)
-            #print(src_file)
-            if src_file.endswith('.c') or src_file.endswith('.h') or src_file.endswith('.cpp'):
-                path_obj = Path(src_file)
-                # 转换为字符串时会使用当前系统的分隔符，可以强制转换为POSIX格式
-                posix_path = path_obj.as_posix()
-                cmake['srcs'] = cmake['srcs'] + '   ${CMAKE_CURRENT_SOURCE_DIR}/'+posix_path+'\n'
-                #cmake['files'].append({'path': src_file,'var':'SRC_FILE' + str(i)})  
-        cmake['srcs'] = cmake['srcs'] +')\n'
-        self.context['cmake'] = cmake
-        
-        #abspath = os.path.abspath(os.path.join(self.path,'CMakeLists.txt'))
-        self.generateFile()
-        #
+        yield '\n \n set(LINKER_FLAGS "-T${CMAKE_LINKER_FILE} ' + ' '.join(LINK_FLAGS) + '")'
+        #配置成果物路径 转换为POSIX格式
+        #相对于项目根目录 生成的文件中不包含本机的绝对路径
+        yield '\n #此处是项目的成果物输出路径 默认默认生成在父目录下/release/project_name中 如果需要修改 请在cmake.py中进行\nSET(OutPut_Path '+self.root+'release)\n'
+
+        yield '\n #generated include paths \n set(Inc_Pro \n'
+        paths = self.project.paths
+        for inc in self.includePaths(self.project.main):
+            yield '   '+self.root+ paths.cmakePath(inc) + '\n'
+        yield ')' + '\n'
+        yield '\n #generated src paths \n set(SRC_Pro \n'
+
+        for file in self.project.main.srcs:
+            src_file = paths.cmakePath(file)
+            if src_file.endswith(SOURCE_SUFFIXES):
+                yield '   '+self.root+src_file+'\n'
+        yield ')\n'
+
+        if len(self.project.targets) > 1 or getattr(self.args, 'group_libs', False):
+            yield from self.iterTargets()
+        if getattr(self.args, 'unity', False):
+            yield from self.iterUnity()
+        if self.Cmake.get('PCH'):
+            yield '\n #generated precompiled headers \n set(PCH_Pro \n'
+            for header in self.Cmake['PCH']:
+                yield '   '+header+'\n'
+            yield ')\n'
+
+    def iterReproducible (self):
+        """
+        产出编译缓存和可重现路径的设置
+        找到 ccache/sccache 时作为编译器启动器 CCACHE_BASEDIR 设为项目根目录
+        -ffile-prefix-map/-fdebug-prefix-map 将目标文件和调试信息中的项目根目录和构建目录替换为 .
+        不同检出目录 不同机器编译出的目标文件相同 共享的编译缓存可以命中
+        """
+        root = self.root_var
+        yield '\n #编译缓存 找到 ccache 或 sccache 时自动使用 可通过 -DCMAKE_C_COMPILER_LAUNCHER= 关闭\n'
+        yield ' if(NOT DEFINED CMAKE_C_COMPILER_LAUNCHER)\n'
+        yield '   find_program(PRO_COMPILER_CACHE NAMES ccache sccache)\n'
+        yield '   if(PRO_COMPILER_CACHE)\n'
+        yield '     set(PRO_LAUNCHER ${CMAKE_COMMAND} -E env CCACHE_BASEDIR='+root+' CCACHE_NOHASHDIR=1 ${PRO_COMPILER_CACHE})\n'
+        yield '     set(CMAKE_C_COMPILER_LAUNCHER ${PRO_LAUNCHER})\n'
+        yield '     set(CMAKE_CXX_COMPILER_LAUNCHER ${PRO_LAUNCHER})\n'
+        yield '     set(CMAKE_ASM_COMPILER_LAUNCHER ${PRO_LAUNCHER})\n'
+        yield '   endif()\n'
+        yield ' endif()\n'
+        yield '\n #可重现的路径 目标文件和调试信息中的项目根目录和构建目录替换为 . (后面的选项优先 构建目录可以在项目根目录中)\n'
+        yield ' set(PRO_PREFIX_MAP "-ffile-prefix-map='+root+'=. -fdebug-prefix-map='+root+'=.'\
+              ' -ffile-prefix-map=${CMAKE_BINARY_DIR}=. -fdebug-prefix-map=${CMAKE_BINARY_DIR}=.")\n'
+        yield ' set(CMAKE_C_FLAGS "${CMAKE_C_FLAGS} ${PRO_PREFIX_MAP}")\n'
+        yield ' set(CMAKE_CXX_FLAGS "${CMAKE_CXX_FLAGS} ${PRO_PREFIX_MAP}")\n'
+        yield ' set(CMAKE_ASM_FLAGS "${CMAKE_ASM_FLAGS} ${PRO_PREFIX_MAP}")\n'
+
+    def iterOptimization (self):
+        """
+        产出按编译类型设置的优化选项 由第一个 Target 的 Keil 优化设置转换 未指定编译类型时使用 Release
+        其他 Target 的优化等级不同时 由 Opt_Pro_<target> 覆盖 (见 planTargets)
+        """
+        options = self.project.main.options
+        flags = optimization.build_type_flags(options, getattr(self.args, 'lto', 'auto'))
+        yield '\n #Keil 优化设置 ' + ' '.join(key + '=' + str(value) for key, value in sorted(options.items())) + \
+              ' 对应的 GCC 选项 未指定编译类型时使用 Release\n'
+        yield ' if(NOT CMAKE_BUILD_TYPE AND NOT CMAKE_CONFIGURATION_TYPES)\n'
+        yield '   set(CMAKE_BUILD_TYPE Release CACHE STRING "Build type" FORCE)\n'
+        yield ' endif()\n'
+        for build_type in optimization.BUILD_TYPES:
+            compile_flags, link_flags = flags[build_type]
+            suffix = build_type.upper()
+            yield ' set(CMAKE_C_FLAGS_' + suffix + ' "' + compile_flags + '")\n'
+            yield ' set(CMAKE_CXX_FLAGS_' + suffix + ' "' + compile_flags + '")\n'
+            yield ' set(CMAKE_ASM_FLAGS_' + suffix + ' "' + ('-g' if '-g' in compile_flags.split() else '') + '")\n'
+            yield ' set(CMAKE_EXE_LINKER_FLAGS_' + suffix + ' "' + link_flags + '")\n'
+
+    def commonDefines (self):
+        """
+        返回所有 Target 共有的宏定义 保持第一个 Target 中的顺序
+        """
+        targets = self.project.targets
+        if len(targets) <= 1:
+            return targets[0].defs
+        shared = set(targets[0].defs).intersection(*(set(target.defs) for target in targets[1:]))
+        return [define for define in targets[0].defs if define in shared]
+
+    def planTargets (self):
+        """
+        规划多个 Target 的编译方式
+        编译设置 (内核 宏定义 头文件路径) 完全相同的 Target 共用的源文件放入一个 OBJECT 库 只编译一次
+        编译设置不同的 Target 之间不共享目标文件 否则会使用错误的宏定义编译
+        --group-libs 时改为每个 Keil 分组一个 OBJECT 库 (见 planGroupLibs)
+
+        Returns:
+            tuple: (libs, targets) 均为 dict 列表
+                libs: {'id', 'srcs', 'defs', 'incs', 'opts'}
+                targets: {'id', 'srcs', 'defs', 'incs', 'opts', 'libs'}
+        """
+        common = set(self.commonDefines())
+        main_level = optimization.optimize_level(self.project.main.options)
+        used_ids = set()
+        plans = []
+        paths = self.project.paths
+        for target in self.project.targets:
+            target_id = cmake_identifier(target.name)
+            #汇总模式下所有工程的目标在同一个构建中 加上工程名避免重名
+            if getattr(self.args, 'aggregate', False):
+                target_id = cmake_identifier(self.project.name) + '_' + target_id
+            while target_id in used_ids:
+                target_id += '_'
+            used_ids.add(target_id)
+
+            srcs = []
+            for file in dict.fromkeys(target.srcs):
+                src_file = paths.cmakePath(file)
+                if src_file.endswith(SOURCE_SUFFIXES):
+                    srcs.append(src_file)
+            level = optimization.optimize_level(target.options)
+            plans.append({
+                'id': target_id,
+                'srcs': srcs,
+                'defs': [define for define in target.defs if define not in common],
+                'incs': [paths.cmakePath(inc) for inc in self.includePaths(target)],
+                #优化等级与第一个 Target 不同时 在 Release 类编译中覆盖
+                'opts': [] if level == main_level else ['$<$<CONFIG:Release,RelWithDebInfo>:' + level + '>'],
+                'libs': [],
+                'signature': (target.ads_cpu_type, tuple(target.defs), tuple(target.incs), level),
+            })
+
+        if getattr(self.args, 'group_libs', False):
+            return self.planGroupLibs(plans, used_ids), plans
+
+        #按编译设置分组
+        groups = {}
+        for plan in plans:
+            groups.setdefault(plan['signature'], []).append(plan)
+
+        libs = []
+        project_id = cmake_identifier(self.project.name)
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            shared = set(members[0]['srcs']).intersection(*(set(plan['srcs']) for plan in members[1:]))
+            if not shared:
+                continue
+            lib_id = project_id + '_common' + (str(len(libs)) if libs else '')
+            while lib_id in used_ids:
+                lib_id += '_'
+            used_ids.add(lib_id)
+            libs.append({
+                'id': lib_id,
+                'srcs': [src for src in members[0]['srcs'] if src in shared],
+                'defs': members[0]['defs'],
+                'incs': members[0]['incs'],
+                'opts': members[0]['opts'],
+            })
+            for plan in members:
+                plan['srcs'] = [src for src in plan['srcs'] if src not in shared]
+                plan['libs'].append(lib_id)
+        return libs, plans
+
+    def planGroupLibs (self, plans, used_ids):
+        """
+        每个 Keil 分组的源文件编译为一个 OBJECT 库 分组的设置 (GroupOption) 只作用于该库
+        修改一个分组中的文件只需要重新编译该分组并重新链接
+        编译设置和源文件都相同的分组在多个 Target 之间共用一个库
+
+        Args:
+            plans: planTargets 规划的 Target 源文件移入库中 并记录链接的库
+            used_ids: 已使用的目标名称
+
+        Returns:
+            list: libs 格式与 planTargets 相同
+        """
+        paths = self.project.paths
+        libs = {}
+        for target, plan in zip(self.project.targets, plans):
+            remaining = set(plan['srcs'])
+            for group in target.groups:
+                #同一个文件只分配到第一次出现的分组
+                srcs = [src for src in dict.fromkeys(paths.cmakePath(file) for file in group.files) if src in remaining]
+                if not srcs:
+                    continue
+                remaining.difference_update(srcs)
+                override = group.override
+                defs = plan['defs'] + (override.defs if override else [])
+                incs = plan['incs'] + ([paths.cmakePath(inc) for inc in override.incs] if override else [])
+                #分组明确设置的优化等级在 Target 的优化等级之后 优先生效
+                opts = plan['opts'] + self.overrideOptions(target.options, override)
+                key = (plan['signature'], group.name, tuple(defs), tuple(incs), tuple(opts), tuple(srcs))
+                lib = libs.get(key)
+                if lib is None:
+                    lib_id = plan['id'] + '_' + cmake_identifier(group.name)
+                    while lib_id in used_ids:
+                        lib_id += '_'
+                    used_ids.add(lib_id)
+                    lib = libs[key] = {'id': lib_id, 'srcs': srcs, 'defs': defs, 'incs': incs, 'opts': opts}
+                plan['libs'].append(lib['id'])
+            plan['srcs'] = [src for src in plan['srcs'] if src in remaining]
+        return list(libs.values())
+
+    def iterFileOverrides (self):
+        """
+        逐段产出 Keil 文件设置 (FileOption) 对应的源文件属性 在所属分组的设置之后生效
+        源文件属性对目录中的所有目标生效 多个 Target 设置不同时使用第一个 Target 的设置
+        """
+        paths = self.project.paths
+        seen = set()
+        for target in self.project.targets:
+            for group in target.groups:
+                group_options = dict(target.options, **group.override.options) if group.override else target.options
+                for file, override in group.file_overrides.items():
+                    src_file = paths.cmakePath(file)
+                    if src_file in seen or not src_file.endswith(SOURCE_SUFFIXES):
+                        continue
+                    seen.add(src_file)
+                    yield '\n set_source_files_properties('+self.root+src_file+' PROPERTIES'
+                    options = self.overrideOptions(group_options, override)
+                    if options:
+                        yield '\n   COMPILE_OPTIONS "'+';'.join(options)+'"'
+                    if override.defs:
+                        yield '\n   COMPILE_DEFINITIONS "'+';'.join(override.defs)+'"'
+                    if override.incs:
+                        yield '\n   INCLUDE_DIRECTORIES "'+';'.join(self.root+paths.cmakePath(inc) for inc in override.incs)+'"'
+                    yield ')\n'
+
+    def iterTargets (self):
+        """
+        逐段产出多个 Target 的源文件 宏定义 头文件路径以及共享的 OBJECT 库 (--group-libs 时为每个分组的库)
+        由 CMakeLists.txt 模板根据 Pro_Targets 创建对应的可执行文件
+        """
+        libs, targets = self.planTargets()
+
+        def iterList(name, items, indent='   ', prefix=self.root):
+            yield '\n set('+name+' \n'
+            for item in items:
+                yield indent+prefix+item+'\n'
+            yield ')\n'
+
+        yield '\n #generated targets \n set(Pro_Targets '+' '.join(plan['id'] for plan in targets)+')\n'
+        yield '\n #generated common object libraries \n set(Pro_Common_Libs '+' '.join(lib['id'] for lib in libs)+')\n'
+        for lib in libs:
+            yield from iterList('SRC_'+lib['id'], lib['srcs'])
+            yield from iterList('Inc_'+lib['id'], lib['incs'])
+            yield from iterList('Def_'+lib['id'], lib['defs'], '  ', '')
+            yield from iterList('Opt_'+lib['id'], lib['opts'], '  ', '')
+        for plan in targets:
+            yield from iterList('SRC_Pro_'+plan['id'], plan['srcs'])
+            yield from iterList('Inc_Pro_'+plan['id'], plan['incs'])
+            yield from iterList('Def_Pro_'+plan['id'], plan['defs'], '  ', '')
+            yield from iterList('Opt_Pro_'+plan['id'], plan['opts'], '  ', '')
+            yield '\n set(Lib_Pro_'+plan['id']+' '+' '.join(plan['libs'])+')\n'
+        if getattr(self.args, 'group_libs', False):
+            yield '\n #generated Keil file options \n'
+            yield from self.iterFileOverrides()
+
+    def planUnity (self):
+        """
+        按 Keil 的源文件分组规划合并编译 (unity build)
+        每个分组按 batch 个文件切分为若干个 UNITY_GROUP 匹配排除列表的文件单独编译
+
+        Returns:
+            tuple: (groups, excluded)
+                groups: [(unity_group_name, [src, ...]), ...]
+                excluded: [src, ...]
+        """
+        batch = max(1, getattr(self.args, 'unity_batch', None) or UNITY_BATCH_SIZE)
+        exclude = getattr(self.args, 'unity_exclude', None) or []
+        paths = self.project.paths
+
+        #不同 Target 中同名的分组合并在一起
+        seen = set()
+        members = {}
+        excluded = []
+        for target in self.project.targets:
+            for group in target.groups:
+                group_members = members.setdefault(group.name, [])
+                for file in group.files:
+                    src_file = paths.cmakePath(file)
+                    #头文件不参与编译 同一个文件只分配到第一次出现的分组
+                    if not src_file.endswith(UNITY_SUFFIXES) or src_file in seen:
+                        continue
+                    seen.add(src_file)
+                    if any(fnmatch.fnmatch(src_file, pattern) or fnmatch.fnmatch(src_file.rsplit('/', 1)[-1], pattern)
+                           for pattern in exclude):
+                        excluded.append(src_file)
+                    else:
+                        group_members.append(src_file)
+
+        groups = []
+        used_names = set()
+        for name, group_members in members.items():
+            group_id = cmake_identifier(name)
+            while group_id in used_names:
+                group_id += '_'
+            used_names.add(group_id)
+            for i in range(0, len(group_members), batch):
+                groups.append((group_id + '_' + str(i // batch), group_members[i:i + batch]))
+        return groups, excluded
+
+    def iterUnity (self):
+        """
+        逐段产出合并编译的设置 每个 UNITY_GROUP 对应 Keil 分组中的一批源文件
+        由 CMakeLists.txt 模板根据 Pro_Unity 为所有目标开启 UNITY_BUILD (GROUP 模式)
+        """
+        groups, excluded = self.planUnity()
+        yield '\n #generated unity build groups \n set(Pro_Unity ON)\n'
+        for name, members in groups:
+            yield '\n set_source_files_properties( \n'
+            for src_file in members:
+                yield '   '+self.root+src_file+'\n'
+            yield '   PROPERTIES UNITY_GROUP "'+name+'")\n'
+        if excluded:
+            yield '\n #excluded from unity build \n set_source_files_properties( \n'
+            for src_file in excluded:
+                yield '   '+self.root+src_file+'\n'
+            yield '   PROPERTIES SKIP_UNITY_BUILD_INCLUSION ON)\n'
+
+    def writeCMake (self, stream):
+        """
+        将 <name>.cmake 的内容直接写入文件或缓冲区
+
+        :param stream: 支持 write(str) 的对象 如打开的文件或 io.StringIO
+        """
+        write = stream.write
+        for chunk in self.iterCMake():
+            write(chunk)
 
-        #print ('Created file CMakeLists.txt [{}]'.format(abspath))
-        
 #    def generateFile (self, pathSrc, pathDst='', author='Pegasus', version='v1.0.0', licence='licence.txt', template_dir='../PegasusTemplates'):
     def generateFile (self):
         cmake_file = Path(self.path/"cmake")
-        cmake_file_name = self.project['name'].text + ".cmake"
+        cmake_file_name = self.project.name + ".cmake"
+        if getattr(self.args, 'aggregate', False):
+            cmake_file = self.subprojectDir()
 
-        Str_file= self.context['cmake']
-        context= self.context_to_text(Str_file)
-        context_str = context.strip('"\'')
+        buffer = io.StringIO()
+        self.writeCMake(buffer)
+        content = buffer.getvalue()
+        tracer.counter('generate', cmake_bytes=len(content))
+        self.output.stage(cmake_file/cmake_file_name, content)
+        if getattr(self.args, 'aggregate', False):
+            self.CmakeSubproject()
 
-        safe_create_file_structure(cmake_file,cmake_file_name,True,context_str)
+    def subprojectDir (self, ProjectName=None):
+        """
+        汇总模式下工程的子目录 cmake/projects/<name>
+        """
+        return Path(self.path)/"cmake"/"projects"/cmake_identifier(ProjectName or self.project.name)
 
 
     
     def CmakeCopyList(self,ProjectName):
-        print(ProjectName)
-        source_path = os.getcwd()
-        source_path = Path(source_path)
-        source_file = Path(source_path/"ProjectToCMAKE"/"cmake.cmake")
-        read_cmake=read_file_with_line_numbers(source_file)
-
-        Set_Project_name = "set(CMAKE_PROJECT_NAME "+ProjectName+")\n"
-        for  i, (num, line) in enumerate(read_cmake):
-            #print(i,num,line)
-            if are_first_n_chars_equal(line,Set_Project_name,22):
-                modified_line = line.replace(line, Set_Project_name)
-                read_cmake[i] = (num, modified_line)
-
-
-        #print(read_cmake)
-        parent_dir = Path(__file__).parent.parent.absolute()
-        target_file = parent_dir/"CMakeLists.txt"
-
-        source_file = Path(source_file)
-        target_file = Path(target_file)
-        #safe_create_file_structure(source_path,"CMakeLists.txt",True,context_str)
-        copy_file_with_custom_name(source_file,target_file)
-        write_file_with_modifications(target_file,read_cmake)
-        return
-        
-    def context_to_text(self,ListDate):
         """
-        将 context 字典转换为自定义文本格式
+        使用模板生成项目根目录下的 CMakeLists.txt 模板可以在 cmake/templates 中按工程覆盖
         """
-        lines = []
-        
-        def process_dict(d, indent=0):
-            for key, value in d.items():
-                if isinstance(value, dict):
-                    lines.append("  " * indent + f"")
-                    process_dict(value, indent + 1)
-                elif isinstance(value, list):
-                    lines.append("  " * indent + f"")
-                    for item in value:
-                        lines.append("  " * (indent + 1) + f"- {item}")
-                else:
-                    lines.append("  " * indent + f" {value}")
-        
-        process_dict(ListDate)#self.context['cmake']
-        #print(lines)
-        return '\n'.join(lines)
-    
+        log.debug("生成 CMakeLists.txt: %s", ProjectName)
+        template = cmaketemplate.find_template('cmake.cmake', self.path, ProjectName)
+        self.output.stage(Path(self.path)/"CMakeLists.txt", template.render({
+            'project_name': ProjectName,
+            'targets': self.renderTargets(ProjectName),
+        }))
+
+    def renderTargets (self, ProjectName):
+        """
+        按工程的 .cmake 中的设置创建目标的部分 单个工程和汇总模式的子目录共用
+        """
+        return cmaketemplate.find_template('targets.cmake', self.path, ProjectName).render({})
+
+    def CmakeSubproject (self):
+        """
+        汇总模式下生成工程子目录中的 CMakeLists.txt
+        """
+        ProjectName = self.project.name
+        template = cmaketemplate.find_template('subproject.cmake', self.path, ProjectName)
+        self.output.stage(self.subprojectDir()/"CMakeLists.txt", template.render({
+            'project_name': ProjectName,
+            'targets': self.renderTargets(ProjectName),
+        }))
+
+    def CmakeAggregate (self, ProjectNames):
+        """
+        汇总模式下生成项目根目录的 CMakeLists.txt 每个工程一个子目录 一次配置编译所有工程
+        """
+        template = cmaketemplate.find_template('aggregate.cmake', self.path)
+        subdirectories = ''.join('add_subdirectory(cmake/projects/' + self.subprojectDir(name).name + ')\n'
+                                 for name in ProjectNames)
+        self.output.stage(Path(self.path)/"CMakeLists.txt", template.render({
+            'project_name': cmake_identifier(Path(self.path).absolute().name),
+            'subdirectories': subdirectories,
+        }))
+
+    def CmakeRule(self, ProjectName):
+        """
+        生成 cmake/Rule.cmake 只 include 工程的 .cmake 内容在工程设置改变时保持不变
+        """
+        template = cmaketemplate.find_template('rule.cmake', self.path, ProjectName)
+        self.output.stage(Path(self.path)/"cmake"/"Rule.cmake", template.render({'cmake_file': ProjectName + '.cmake'}))
+
     def copy_file_with_custom_name(source_file, target_file):
         """
     跨平台复制文件到指定路径（可自定义文件名）
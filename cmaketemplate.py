@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+""" CMakeLists.txt 和 Rule.cmake 使用的模板
+    模板中使用 {{name}} 作为占位符 不会与 CMake 的 ${var} 和 @var@ 冲突
+    模板只解析一次 解析结果 (文本片段和占位符名称) 按文件缓存 渲染时只需一次 join
+    可以在 <项目根目录>/cmake/templates 中放置同名模板覆盖默认模板
+    @file
+"""
+
+import os
+import re
+from pathlib import Path
+
+PLACEHOLDER_RE = re.compile(r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}')
+#默认模板所在的目录 (本工具所在目录)
+DEFAULT_TEMPLATE_DIR = Path(__file__).parent
+#项目中覆盖模板的目录 (相对于项目根目录)
+OVERRIDE_DIR = Path('cmake')/'templates'
+
+class Template(object):
+    """ Template parsed once into literal text and placeholder names
+    """
+
+    __slots__ = ('parts', 'names')
+
+    def __init__(self, text):
+        #偶数位置为文本片段 奇数位置为占位符名称
+        self.parts = PLACEHOLDER_RE.split(text)
+        self.names = frozenset(self.parts[1::2])
+
+    def render(self, values):
+        """ Render the template
+        @param values dict of placeholder name to text
+        @return Rendered text
+        """
+        missing = self.names.difference(values)
+        if missing:
+            raise KeyError("模板缺少参数: " + ', '.join(sorted(missing)))
+        parts = self.parts[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = str(values[parts[i]])
+        return ''.join(parts)
+
+#模板文件路径 -> ((mtime_ns, size), Template)
+_cache = {}
+
+def load_template(file_path):
+    """
+    读取并解析模板 文件未改变时返回缓存的解析结果
+
+    :param file_path: 模板文件路径
+    :return: Template
+    """
+    file_path = str(file_path)
+    stat = os.stat(file_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get(file_path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with open(file_path, 'r', encoding='utf-8') as file:
+        template = Template(file.read())
+    _cache[file_path] = (signature, template)
+    return template
+
+def find_template(name, root, project_name=None):
+    """
+    查找模板 依次使用
+        <root>/cmake/templates/<project_name>/<name>  只对该工程生效
+        <root>/cmake/templates/<name>                 对项目中的所有工程生效
+        本工具目录下的 <name>                          默认模板
+
+    :param name: 模板文件名 如 cmake.cmake
+    :param root: 项目根目录
+    :param project_name: 工程名称
+    :return: Template
+    """
+    candidates = []
+    if project_name:
+        candidates.append(Path(root)/OVERRIDE_DIR/project_name/name)
+    candidates.append(Path(root)/OVERRIDE_DIR/name)
+    for candidate in candidates:
+        if candidate.is_file():
+            return load_template(candidate)
+    return load_template(DEFAULT_TEMPLATE_DIR/name)
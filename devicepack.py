@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+""" 器件启动文件和链接脚本的索引
+    扫描项目目录以及本地的 CMSIS/CubeMX 器件包目录 记录 GCC 启动文件 (startup_*.s) 和链接脚本 (*.ld)
+    按 Keil 工程的 Device (如 STM32F103C8) 查找对应的文件 每个工程只需要几次字典查找
+    每个目录的内容按目录的修改时间缓存在 cmake/.cache/index 中 目录未改变时不需要重新读取
+    @file
+"""
+
+import os
+import re
+import fnmatch
+import logging
+from pathlib import Path
+from outputstage import read_pickle, write_pickle
+
+log = logging.getLogger(__name__)
+
+#启动文件和链接脚本的后缀
+STARTUP_SUFFIXES = ('.s', '.S')
+LINKER_SUFFIXES = ('.ld',)
+#这些目录中的启动文件是 ARMCC/IAR 语法 GCC 无法编译
+FOREIGN_DIRS = {'arm', 'iar', 'mdk-arm', 'ewarm'}
+#STM32 型号中表示 Flash 容量的字符 从小到大
+STM32_FLASH_CODES = '468bcdefghi'
+#链接脚本名称结尾的封装/温度代码 如 STM32F103C8Tx_FLASH.ld 中的 Tx
+PACKAGE_SUFFIX_RE = re.compile(r'[a-z]x$')
+
+def device_keys(device):
+    """
+    返回器件型号可能对应的文件名称 (小写 不含 startup_ 前缀和后缀) 按优先级排序
+
+    例如 STM32F103C8 -> stm32f103c8, stm32f103x8, stm32f103xb, ... stm32f103xx, stm32f103cx ...
+    STM32 的启动文件按容量分组命名 (x8 与 xb 共用 startup_stm32f103xb.s) 因此依次尝试更大的容量
+
+    Args:
+        device: Keil 工程中的 Device
+    """
+    device = device.strip().lower()
+    if not device:
+        return []
+    keys = [device]
+    if device.startswith('stm32') and len(device) >= 11:
+        line, flash = device[:9], device[10]
+        if flash in STM32_FLASH_CODES:
+            keys.extend(line + 'x' + code for code in STM32_FLASH_CODES[STM32_FLASH_CODES.index(flash):])
+        keys.append(line + 'xx')
+    #通用的写法 末尾若干位替换为 x 如 lpc1768 -> lpc176x, lpc17xx
+    for count in range(1, min(4, len(device) - 1)):
+        keys.append(device[:-count] + 'x' * count)
+    return list(dict.fromkeys(keys))
+
+def file_keys(file_name):
+    """
+    返回文件用于查找的名称 startup_stm32f103xb.s -> stm32f103xb  STM32F103C8Tx_FLASH.ld -> stm32f103c8tx, stm32f103c8
+    """
+    stem = file_name.rsplit('.', 1)[0].lower()
+    if stem.startswith('startup_'):
+        stem = stem[len('startup_'):]
+    token = stem.split('_', 1)[0]
+    keys = [token]
+    stripped = PACKAGE_SUFFIX_RE.sub('', token)
+    if stripped != token and not token.endswith('xx'):
+        keys.append(stripped)
+    return keys
+
+def rank(file_path, kind):
+    """
+    同名文件的优先级 数值越小越优先 None 表示不可用
+    启动文件优先使用 gcc 目录中的文件 链接脚本优先使用 FLASH 版本
+    """
+    parts = {part.lower() for part in Path(file_path).parent.parts}
+    if kind == 'startup':
+        if parts & FOREIGN_DIRS:
+            return None
+        return 0 if 'gcc' in parts else 1
+    name = Path(file_path).name.lower()
+    return (0 if 'gcc' in parts else 1) + (0 if 'flash' in name else 2)
+
+def near_set(directories):
+    """
+    返回目录及其所有上级目录的集合 (统一大小写和分隔符) 用于计算文件与工程的距离
+    """
+    result = set()
+    for directory in directories:
+        directory = os.path.normcase(os.path.abspath(directory))
+        while directory not in result:
+            result.add(directory)
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+    return result
+
+def has_project(directory):
+    """
+    目录或其下一级目录中是否有 Keil 工程 (如 proj2/MDK-ARM/Other.uvprojx)
+    """
+    try:
+        return any(Path(directory).glob('*.uvprojx')) or any(Path(directory).glob('*/*.uvprojx'))
+    except OSError:
+        return False
+
+def proximity(file_path, near):
+    """
+    文件与工程的距离 数值越小越近 near 为 near_set 的结果 为空时所有文件的距离相同
+    位于其他工程目录中的文件最后考虑 其次比较与工程目录的共同上级目录的深度 (越深越近) 最后比较文件在该目录下的层数
+    """
+    if not near:
+        return (False, 0, 0)
+    directory = os.path.normcase(os.path.dirname(os.path.abspath(file_path)))
+    between = []
+    while directory not in near:
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        between.append(directory)
+        directory = parent
+    foreign = any(has_project(d) for d in between)
+    return (foreign, -len(Path(directory).parts), len(between))
+
+class DevicePackIndex(object):
+    """ On-disk index of GCC startup files and linker scripts keyed by device name
+    """
+
+    def __init__(self, roots, cache_file=None, exclude=()):
+        """
+        Args:
+            roots: 需要扫描的目录列表 (项目目录和器件包目录)
+            cache_file: 目录缓存文件 None 表示不缓存
+            exclude: 跳过的目录 glob
+        """
+        self.roots = [str(Path(root).absolute()) for root in roots]
+        self.cache_file = cache_file
+        self.exclude = tuple(exclude)
+        #目录 -> (mtime_ns, 匹配的文件名列表, 子目录名列表)
+        self.dirs = {}
+        self.dirty = False
+        #名称 -> 按优先级排序的文件路径列表
+        self.startup = {}
+        self.linker = {}
+
+    def __getstate__(self):
+        #传给进程池时只需要查找表
+        return {'startup': self.startup, 'linker': self.linker}
+
+    def __setstate__(self, state):
+        self.__init__([])
+        self.startup = state['startup']
+        self.linker = state['linker']
+
+    def load(self):
+        if self.cache_file is None:
+            return
+        self.dirs = read_pickle(self.cache_file, {})
+
+    def save(self):
+        """ Write the directory cache back to disk if it changed
+        """
+        if self.cache_file is None or not self.dirty:
+            return
+        try:
+            write_pickle(self.cache_file, self.dirs)
+            self.dirty = False
+        except Exception as e:
+            log.warning("器件索引缓存写入失败: %s", e)
+
+    def listDir(self, directory):
+        """
+        返回目录中的启动文件/链接脚本以及子目录 目录的修改时间未改变时使用缓存
+        """
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return [], []
+        cached = self.dirs.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], cached[2]
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.name.endswith(STARTUP_SUFFIXES + LINKER_SUFFIXES):
+                            files.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            return [], []
+        files.sort()
+        subdirs.sort()
+        self.dirs[directory] = (mtime, files, subdirs)
+        self.dirty = True
+        return files, subdirs
+
+    def refresh(self):
+        """ Walk all roots (reusing cached listings of unchanged directories) and rebuild the lookup tables
+        """
+        self.load()
+        startup = {}
+        linker = {}
+        visited = set()
+        stack = list(reversed(self.roots))
+        while stack:
+            directory = stack.pop()
+            if directory in visited:
+                continue
+            visited.add(directory)
+            files, subdirs = self.listDir(directory)
+            for name in files:
+                file_path = os.path.join(directory, name)
+                kind = 'startup' if name.endswith(STARTUP_SUFFIXES) else 'linker'
+                if kind == 'startup' and not name.lower().startswith('startup_'):
+                    continue
+                order = rank(file_path, kind)
+                if order is None:
+                    continue
+                table = startup if kind == 'startup' else linker
+                for key in file_keys(name):
+                    table.setdefault(key, []).append((order, file_path))
+            stack.extend(os.path.join(directory, name) for name in reversed(subdirs)
+                         if not any(fnmatch.fnmatch(name, pattern) for pattern in self.exclude))
+
+        #删除已经不存在的目录
+        for directory in list(self.dirs):
+            if directory not in visited:
+                del self.dirs[directory]
+                self.dirty = True
+        self.startup = {key: [path for _, path in sorted(files)] for key, files in startup.items()}
+        self.linker = {key: [path for _, path in sorted(files)] for key, files in linker.items()}
+        self.save()
+        return self
+
+    def lookup(self, device, near=()):
+        """
+        查找器件对应的启动文件和链接脚本
+        离工程最近的文件优先 (同一棵目录树中有多个工程时 不会使用其他工程的文件)
+        距离相同时按名称的优先级 (device_keys) 和文件的优先级 (rank) 选择 器件包目录中的文件通常最远
+
+        Args:
+            device: Keil 工程中的 Device 如 STM32F103C8
+            near: 工程使用的目录 (uvprojx 所在目录 头文件路径 源文件所在目录)
+
+        Returns:
+            tuple: (startup, linker) 未找到时为 None
+        """
+        near = near_set(near)
+        keys = device_keys(device)
+        found = []
+        for table in (self.startup, self.linker):
+            candidates = [(proximity(file_path, near), order, position, file_path)
+                          for order, key in enumerate(keys)
+                          for position, file_path in enumerate(table.get(key, ()))]
+            found.append(min(candidates)[-1] if candidates else None)
+        return tuple(found)
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+""" 源文件 #include 依赖扫描
+    读取源文件中的 #include 指令 按 Keil 工程的头文件路径解析 建立包含关系图
+    每个文件的 #include 列表按修改时间缓存 文件未改变时不需要重新读取
+    扫描结果用于选择预编译头文件 以及分析实际使用的头文件路径
+    @file
+"""
+
+import os
+import re
+import logging
+from pathlib import Path
+from outputstage import read_pickle, write_pickle
+
+log = logging.getLogger(__name__)
+
+#匹配 #include "xxx.h" 和 #include <xxx.h> 宏形式的 #include 无法静态解析 直接忽略
+INCLUDE_RE = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\r\n]+)[>"]', re.M)
+#参与编译的源文件后缀
+TU_SUFFIXES = ('.c', '.cpp', '.cc', '.cxx')
+
+class IncludeScanner(object):
+    """ Scan #include directives and resolve them against project include paths
+    """
+
+    def __init__(self, base_dir, incs, cache_file=None):
+        """
+        Args:
+            base_dir: uvprojx 文件所在目录 工程中的相对路径都相对于该目录
+            incs: 工程的头文件路径列表 (相对路径)
+            cache_file: #include 列表的缓存文件 None 表示不缓存
+        """
+        self.base_dir = Path(base_dir)
+        self.inc_dirs = [os.path.normpath(os.path.join(self.base_dir, str(inc))) for inc in incs]
+        self.cache_file = cache_file
+        self.cache = {}
+        self.cache_dirty = False
+        #file -> [(header, inc_index), ...] inc_index 为 None 表示在包含者所在目录找到
+        self.graph = {}
+        #inc_index -> 通过该路径找到头文件的次数
+        self.hits = [0] * len(self.inc_dirs)
+        #header name -> 可以找到该名称的所有头文件路径序号 用于检查遮蔽
+        self.candidates = {}
+        self._resolved = {}
+        self._listings = {}
+        self.load()
+
+    def load(self):
+        if self.cache_file is None:
+            return
+        self.cache = read_pickle(self.cache_file, {})
+
+    def save(self):
+        """ Write the directive cache back to disk if it changed
+        """
+        if self.cache_file is None or not self.cache_dirty:
+            return
+        try:
+            write_pickle(self.cache_file, self.cache)
+            self.cache_dirty = False
+        except Exception as e:
+            log.warning("#include 缓存写入失败: %s", e)
+
+    def directives(self, file):
+        """
+        返回文件中的 #include 指令 按文件修改时间和大小缓存
+
+        Returns:
+            list: [(quote, name), ...] quote 为 '"' 或 '<' 文件不存在时返回 None
+        """
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+        cached = self.cache.get(file)
+        if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        try:
+            with open(file, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        found = [(m.group(1).decode('ascii'), m.group(2).strip().decode('utf-8', 'replace'))
+                 for m in INCLUDE_RE.finditer(data)]
+        self.cache[file] = (stat.st_mtime_ns, stat.st_size, found)
+        self.cache_dirty = True
+        return found
+
+    def _exists(self, directory, name):
+        """ 判断 directory/name 是否存在 同一目录只列出一次 """
+        if '/' in name or '\\' in name:
+            return os.path.isfile(os.path.join(directory, name))
+        listing = self._listings.get(directory)
+        if listing is None:
+            try:
+                listing = set(os.listdir(directory))
+            except OSError:
+                listing = set()
+            self._listings[directory] = listing
+        return name in listing
+
+    def resolve(self, quote, name, including_dir):
+        """
+        按编译器的查找顺序解析头文件
+        "xxx.h" 先在包含者所在目录查找 然后按顺序查找头文件路径 <xxx.h> 只查找头文件路径
+
+        Returns:
+            tuple: (header, inc_index) 未找到时返回 (None, None)
+        """
+        key = (quote, name, including_dir if quote == '"' else None)
+        result = self._resolved.get(key)
+        if result is not None:
+            return result
+
+        result = (None, None)
+        if quote == '"' and self._exists(including_dir, name):
+            result = (os.path.normpath(os.path.join(including_dir, name)), None)
+        matches = [i for i, directory in enumerate(self.inc_dirs) if self._exists(directory, name)]
+        if matches:
+            self.candidates[name] = matches
+            if result[0] is None:
+                result = (os.path.normpath(os.path.join(self.inc_dirs[matches[0]], name)), matches[0])
+        self._resolved[key] = result
+        return result
+
+    def scan(self, sources):
+        """
+        从源文件开始遍历 建立完整的包含关系图
+
+        Args:
+            sources: 源文件列表 (相对于 base_dir 的路径)
+
+        Returns:
+            list: 实际存在的源文件绝对路径
+        """
+        roots = []
+        stack = []
+        for src in sources:
+            file = os.path.normpath(os.path.join(self.base_dir, str(src)))
+            if file not in roots:
+                roots.append(file)
+                stack.append(file)
+        while stack:
+            file = stack.pop()
+            if file in self.graph:
+                continue
+            found = self.directives(file)
+            if found is None:
+                self.graph[file] = []
+                continue
+            edges = []
+            including_dir = os.path.dirname(file)
+            for quote, name in found:
+                header, inc_index = self.resolve(quote, name, including_dir)
+                if header is None:
+                    continue
+                if inc_index is not None:
+                    self.hits[inc_index] += 1
+                edges.append((header, inc_index))
+                if header not in self.graph:
+                    stack.append(header)
+            self.graph[file] = edges
+        self.save()
+        return [file for file in roots if self.graph.get(file) or os.path.isfile(file)]
+
+    def closure(self, file, memo):
+        """ 返回文件直接或间接包含的所有头文件 """
+        result = memo.get(file)
+        if result is not None:
+            return result
+        memo[file] = frozenset()
+        result = set()
+        for header, _ in self.graph.get(file, ()):
+            result.add(header)
+            result |= self.closure(header, memo)
+        result = frozenset(result)
+        memo[file] = result
+        return result
+
+    def precompiledHeaders(self, sources, max_headers=3, threshold=0.5):
+        """
+        选择被最多编译单元包含的头文件作为预编译头
+        被其他已选头文件间接包含的头文件不重复选择
+
+        Args:
+            sources: 源文件列表 (相对于 base_dir 的路径)
+            max_headers: 最多选择的头文件数量
+            threshold: 至少被该比例的编译单元包含才会被选择
+
+        Returns:
+            list: 头文件绝对路径 按包含次数从多到少排序
+        """
+        units = [file for file in self.scan(sources) if file.lower().endswith(TU_SUFFIXES)]
+        if not units:
+            return []
+        memo = {}
+        counts = {}
+        for unit in units:
+            for header in self.closure(unit, memo):
+                counts[header] = counts.get(header, 0) + 1
+
+        minimum = max(2, threshold * len(units))
+        candidates = [header for header, count in counts.items() if count >= minimum]
+        candidates.sort(key=lambda header: (-counts[header], -len(self.closure(header, memo)), header))
+        selected = []
+        for header in candidates:
+            if any(header in self.closure(chosen, memo) for chosen in selected):
+                continue
+            selected = [chosen for chosen in selected if chosen not in self.closure(header, memo)]
+            selected.append(header)
+            if len(selected) >= max_headers:
+                break
+        return selected
+
+    def includeOrder(self, sources):
+        """
+        分析头文件路径的使用情况 删除未使用的路径 其余按查找命中次数从多到少排序
+        若同名头文件存在于多个路径中 调整顺序后必须保证原来优先的路径仍然排在前面
+        否则会找到另一个同名文件 (遮蔽) 这些路径保持原来的相对顺序并给出警告
+
+        Args:
+            sources: 源文件列表 (相对于 base_dir 的路径)
+
+        Returns:
+            tuple: (order, removed, shadowed)
+                order: 保留的路径序号 按新的顺序排列
+                removed: 删除的路径序号
+                shadowed: [(header name, [路径序号, ...]), ...] 存在同名头文件的路径
+        """
+        self.scan(sources)
+        kept = [i for i, hit in enumerate(self.hits) if hit > 0]
+        removed = [i for i, hit in enumerate(self.hits) if hit == 0]
+
+        #原来优先的路径必须排在同名头文件所在的其他路径之前
+        before = {i: set() for i in kept}
+        shadowed = []
+        for name, matches in sorted(self.candidates.items()):
+            matches = [i for i in matches if i in before]
+            if len(matches) < 2:
+                continue
+            shadowed.append((name, matches))
+            for i in matches[1:]:
+                before[i].add(matches[0])
+
+        #按命中次数排序 同时满足上面的先后约束 (约束来自原来的顺序 不会形成环)
+        order = []
+        placed = set()
+        pending = list(kept)
+        while pending:
+            ready = [i for i in pending if before[i] <= placed]
+            best = min(ready, key=lambda i: (-self.hits[i], i))
+            order.append(best)
+            placed.add(best)
+            pending.remove(best)
+        return order, removed, shadowed
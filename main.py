@@ -1,34 +1,106 @@
 import os
+import sys
+import fnmatch
+import io
+import contextlib
+import logging
+import traceback
 from pathlib import Path
 import argparse
-from uvprojxproject import UVPROJXProject
-import cmake
+from outputstage import OutputStage
+from tracing import tracer
+import watch
 import shutil
 
 """
 Class to parse UVPROJX project file formatfrom
 //查找当前目录下的对应的uvprojx文件class UVPROJXProject:
 """
-def get_files_by_extensions(directory, extensions):
+#默认跳过的目录 Keil 的中间文件/列表文件目录 以及构建输出和版本库目录
+DEFAULT_EXCLUDES = ('.git', 'Objects', 'Listings', 'build', 'release', '__pycache__')
+LOG_LEVELS = ('debug', 'info', 'warning', 'error')
+
+log = logging.getLogger('main')
+
+class StdoutHandler(logging.StreamHandler):
+    """ 输出到当前的 sys.stdout 进程池中 redirect_stdout 捕获的输出也包括日志
+    """
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+def setup_logging(level):
+    """
+    设置日志等级 逐个文件的详细输出为 debug 等级 默认 (info) 不输出也不格式化
+
+    :param level: LOG_LEVELS 中的一个
+    """
+    root = logging.getLogger()
+    if not any(isinstance(handler, StdoutHandler) for handler in root.handlers):
+        handler = StdoutHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        root.addHandler(handler)
+    root.setLevel(getattr(logging, level.upper()))
+
+def walk_files(directory, extensions, exclude=DEFAULT_EXCLUDES, max_depth=None):
+    """
+    单次遍历目录树 逐个产出匹配任意一个后缀的文件
+    使用 os.scandir 遍历 被排除的目录不会进入 同一目录内按名称排序 保证结果顺序确定
+
+    :param directory: 要搜索的目录路径
+    :param extensions: 后缀元组如 ('.jpg', '.png')
+    :param exclude: 排除的 glob 列表 与目录名或相对路径匹配
+    :param max_depth: 最大递归深度 0 表示只搜索 directory 本身 None 表示不限制
+    :return: 匹配文件的生成器 (Path)
+    """
+    root = Path(directory)
+    suffixes = tuple('.' + ext.lstrip('.').lower() for ext in extensions)
+    exclude = tuple(exclude or ())
+
+    stack = [(str(root), '', 0)]
+    while stack:
+        current, relative, depth = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if max_depth is not None and depth >= max_depth:
+                    continue
+                entry_relative = relative + entry.name
+                if any(fnmatch.fnmatch(entry.name, pattern) or fnmatch.fnmatch(entry_relative, pattern)
+                       for pattern in exclude):
+                    continue
+                subdirs.append((entry.path, entry_relative + '/', depth + 1))
+            elif entry.name.lower().endswith(suffixes):
+                yield Path(entry.path)
+        #逆序压栈 保证先序遍历按名称顺序进行
+        stack.extend(reversed(subdirs))
+
+def get_files_by_extensions(directory, extensions, exclude=DEFAULT_EXCLUDES, max_depth=None):
     """
     获取匹配任意一个后缀的文件
     
     :param directory: 要搜索的目录路径
     :param extensions: 后缀元组如 ('.jpg', '.png')
+    :param exclude: 排除的 glob 列表 详见 walk_files
+    :param max_depth: 最大递归深度 详见 walk_files
     :return: 匹配的文件列表
     """
-    folder = Path(directory)
-    
-    # 确保扩展名不以点开头（pathlib会自动处理）
-    extensions = [ext.lstrip('.') for ext in extensions]
-    
-    matched_files = []
-    
-    for ext in extensions:
-        matched_files.extend(folder.rglob(f'*.{ext}'))
-        #print(extensions);
-    
-    return matched_files
+    return list(walk_files(directory, extensions, exclude, max_depth))
 
 def copy_file_with_custom_name(source_file, target_file):
     """
@@ -85,51 +157,356 @@ def are_paths_identical(path1, path2):
         print(f"路径比较错误: {e}")
         return False
 
+def parse_arguments(argv=None):
+    """
+    解析命令行参数 只在进程启动时解析一次
+
+    :param argv: 参数列表 默认读取 sys.argv
+    :return: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(description='Convert Keil MDK uvprojx projects to CMake', add_help=True)
+    parser.add_argument('--parent_dir', nargs='?', default=None, help="Root directory of project")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Number of projects converted in parallel (0 = number of CPUs)")
+    parser.add_argument('--only', action='append', default=[], metavar='UVPROJX',
+                        help="Convert only this uvprojx file instead of searching the project (used by the generated .cmake when the uvprojx changed)")
+    parser.add_argument('--exclude', action='append', default=[], metavar='GLOB',
+                        help="Additional directory glob skipped while searching for projects")
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help="Maximum directory depth searched for projects")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Always parse uvprojx files, ignoring the parse cache in cmake/.cache")
+    parser.add_argument('--unity', action='store_true',
+                        help="Enable unity (jumbo) builds grouped by Keil source groups")
+    parser.add_argument('--unity-batch', type=int, default=None,
+                        help="Maximum number of sources merged into one unity file per group (default: 8)")
+    parser.add_argument('--unity-exclude', action='append', default=[], metavar='GLOB',
+                        help="Source file glob compiled separately in unity mode (e.g. files with clashing static symbols)")
+    parser.add_argument('--group-libs', action='store_true',
+                        help="Build each Keil source group as an OBJECT library with its GroupOption/FileOption overrides")
+    parser.add_argument('--pch', action='store_true',
+                        help="Scan #include directives and precompile the most widely included headers")
+    parser.add_argument('--pch-max', type=int, default=3,
+                        help="Maximum number of precompiled headers")
+    parser.add_argument('--pch-threshold', type=float, default=0.5,
+                        help="Minimum fraction of translation units that must include a precompiled header")
+    parser.add_argument('--prune-incs', action='store_true',
+                        help="Drop include paths no source uses and order the rest by lookup hits")
+    parser.add_argument('--pack-root', action='append', default=[], metavar='DIR',
+                        help="Additional CMSIS/CubeMX device pack directory searched for startup files and linker scripts")
+    parser.add_argument('--no-device-pack', dest='device_pack', action='store_false',
+                        help="Do not look up startup files and linker scripts for the project's device")
+    parser.add_argument('--lto', choices=('auto', 'on', 'off'), default='auto',
+                        help="Link-time optimization for release builds: follow the Keil setting, or force on/off")
+    parser.add_argument('--cache-size', type=int, default=None,
+                        help="Maximum size of the parse cache in MB (default: 64)")
+    parser.add_argument('--xml-backend', choices=('auto', 'lxml', 'etree'), default='auto',
+                        help="XML parser for uvprojx files: lxml, the standard library, or lxml when installed")
+    parser.add_argument('--no-compile-commands', dest='compile_commands', action='store_false',
+                        help="Do not write compile_commands.json for clangd and other editors")
+    parser.add_argument('--aggregate', action='store_true',
+                        help="Write one top-level CMakeLists.txt building every project (cmake/projects/<name>)")
+    parser.add_argument('--ninja', action='store_true',
+                        help="Also write cmake/<name>.ninja, built directly with ninja -f without a CMake configure")
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='info',
+                        help="Output verbosity; per-file details are printed at debug level")
+    parser.add_argument('--timings', action='store_true',
+                        help="Print time spent in each conversion phase")
+    parser.add_argument('--trace', default=None, metavar='FILE',
+                        help="Write spans and counters in Chrome trace-event format (chrome://tracing, Perfetto)")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and regenerate a project whenever its uvprojx file changes")
+    parser.add_argument('--watch-interval', type=float, default=watch.DEFAULT_INTERVAL,
+                        help="Polling interval of --watch in seconds")
+    #"--ewp", help="Search for *.EWP file in project structure", action='store_true')
+    #parser.add_argument("--uvprojx", help="Search for *.UPROJX file in project structure", action='store_true')
+    return parser.parse_args(argv)
+
+def convert_project(file, args, cmake_Pro_file, capture=False):
+    """
+    解析单个 uvprojx 工程并生成对应的 .cmake 文件
+    可以在进程池中运行 返回值只包含可序列化的数据
+
+    Args:
+        file: uvprojx 文件路径
+        args: 命令行参数
+        cmake_Pro_file: CMAKE放置的根目录
+        capture: 是否捕获该工程的打印输出 (进程池模式下保证输出顺序确定)
+
+    Returns:
+        dict: {'file', 'name', 'outputs', 'log', 'error', 'trace', 'commands'} outputs 为暂存的 (路径, 内容) 列表
+        trace 为进程池中记录的耗时事件 由主进程合并 commands 为该工程的 compile_commands.json 条目
+    """
+    result = {'file': str(file), 'name': None, 'outputs': [], 'log': '', 'error': None, 'trace': [], 'commands': ''}
+    #进程池使用 spawn 启动时 子进程需要重新设置
+    setup_logging(args.log_level)
+    tracer.enable(args.timings or args.trace is not None)
+    if capture:
+        #fork 启动的子进程会继承主进程已记录的事件
+        tracer.drain()
+    output = io.StringIO()
+    #延迟导入 没有找到工程时不需要加载解析和生成模块
+    import uvprojxproject
+    import projectcache
+    import cmake
+    import ninjabuild
+    with contextlib.redirect_stdout(output) if capture else contextlib.nullcontext(), \
+            tracer.span('project', cat='project', file=str(file)):
+        try:
+            project_args = argparse.Namespace(**vars(args))
+            if project_args.parent_dir is None:
+                project_args.parent_dir = str(file.parent)
+            project_data = None
+            if not args.no_cache:
+                with tracer.span('cache lookup'):
+                    max_bytes = projectcache.DEFAULT_MAX_BYTES if args.cache_size is None else args.cache_size * 1024 * 1024
+                    cache = projectcache.ProjectCache(Path(cmake_Pro_file)/"cmake"/".cache",
+                                                      uvprojxproject.__version__, max_bytes)
+                    cache_key = cache.key(file)
+                    project_data = cache.load(cache_key)
+            if project_data is None:
+                with tracer.span('parse'):
+                    project = uvprojxproject.UVPROJXProject(project_args, file, args.xml_backend)
+                    project.parseProject()
+                    project_data = project.getProject()
+                if not args.no_cache:
+                    with tracer.span('cache store'):
+                        cache.store(cache_key, project_data)
+            else:
+                log.debug("工程未改变 使用解析缓存: %s", file)
+            #缓存中的工程可能来自其他位置的相同文件 使用本次找到的路径
+            project_data.uvprojx = str(file)
+            if args.aggregate:
+                #汇总模式下所有工程都以 PRO_ROOT 为根 按 uvprojx 所在目录换算路径 不能假设 uvprojx 位于根目录的下一级
+                base = Path(os.path.relpath(Path(file).absolute().parent, Path(cmake_Pro_file).absolute())).as_posix()
+                outside = project_data.paths.rebase(base)
+                if outside:
+                    log.warning("工程 %s 中有 %d 个路径位于项目根目录之外: %s", file, outside, Path(cmake_Pro_file).absolute())
+            tracer.counter('project', sources=len({i for target in project_data.targets for i in target.srcs}),
+                           include_paths=len({i for target in project_data.targets for i in target.incs}))
+            CmakeFile = cmake.CMake(project_data, cmake_Pro_file, args=args)
+            with tracer.span('analyse'):
+                CmakeFile.AnalyseCmake()
+            with tracer.span('generate'):
+                CmakeFile.populateCMake()
+            if args.compile_commands:
+                with tracer.span('compile commands'):
+                    result['commands'] = ',\n'.join(CmakeFile.iterCompileCommands())
+            if args.ninja:
+                with tracer.span('generate ninja'):
+                    NinjaFile = ninjabuild.Ninja(project_data, cmake_Pro_file, CmakeFile.output, args)
+                    NinjaFile.Cmake = CmakeFile.Cmake
+                    NinjaFile.populateNinja()
+            result['name'] = project_data.name
+            result['outputs'] = CmakeFile.output.items()
+        except Exception:
+            result['error'] = traceback.format_exc()
+    result['log'] = output.getvalue()
+    if capture:
+        result['trace'] = tracer.drain()
+    return result
+
+def convert_projects(matched_files, args, cmake_Pro_file):
+    """
+    转换所有工程 jobs > 1 时使用进程池并行处理
+    结果按 matched_files 的顺序返回 保证输出确定
+
+    :return: 每个工程的结果列表
+    """
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    jobs = min(jobs, len(matched_files))
+    if jobs <= 1:
+        return [convert_project(file, args, cmake_Pro_file) for file in matched_files]
+
+    import concurrent.futures
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(convert_project, file, args, cmake_Pro_file, True) for file in matched_files]
+        for future in futures:
+            result = future.result()
+            print(result['log'], end='')
+            tracer.merge(result['trace'])
+            results.append(result)
+    return results
+
+def stage_rule_files(output, cmake_Pro_file):
+    """
+    只有一个工程时 暂存 Rule.cmake 和 CMakeLists.txt
+    Rule.cmake 只 include 工程的 .cmake 两个文件都由模板生成 (见 cmaketemplate.py)
+
+    :param output: OutputStage 已暂存本次生成的 .cmake
+    :param cmake_Pro_file: CMAKE放置的根目录
+    """
+    cmake_path = Path(cmake_Pro_file)/"cmake"
+    cmake_rule_path = Path(cmake_path/'Rule.cmake')
+
+    #磁盘上已有的 .cmake 加上本次生成的 .cmake 不包括 Rule.cmake 本身
+    cmake_dir = set(get_files_by_extensions(cmake_path, ['.cmake'], max_depth=0))
+    cmake_dir.update(Path(file_path) for file_path, _ in output.items()
+                     if Path(file_path).parent == cmake_path and file_path.endswith('.cmake'))
+    cmake_dir.discard(cmake_rule_path)
+    cmake_dir = sorted(cmake_dir)
+    cmake_lenth = len(cmake_dir)
+    log.debug("%s %d", cmake_dir, cmake_lenth)
+    projectName = None
+    for cmake_file in cmake_dir:
+        if cmake_lenth == 1:
+            log.info("该项目只有一个工程 自动复制该编译配置 并进行编译")
+            log.debug("%s", cmake_rule_path)
+            projectName = Path(cmake_file).stem
+
+    if projectName is not None:
+        import cmake
+        with tracer.span('render CMakeLists'):
+            generator = cmake.CMake(None, cmake_Pro_file, output)
+            generator.CmakeRule(projectName)
+            generator.CmakeCopyList(projectName)
+    else:
+        log.info("存在多个工程 请手动选择需要编译的 .cmake 在 Rule.cmake 中 include 或复制为 Rule.cmake")
+
+def stage_aggregate(output, results, cmake_Pro_file):
+    """
+    汇总模式 暂存顶层 CMakeLists.txt 每个转换成功的工程一个子目录
+    名称相同的工程使用同一个子目录 只保留第一个
+
+    :param results: convert_project 的结果列表
+    """
+    import cmake
+    names = {}
+    for result in results:
+        if result['error'] or result['name'] is None:
+            continue
+        subdir = cmake.cmake_identifier(result['name'])
+        if subdir in names:
+            log.error("❌ 工程 %s 与 %s 的名称相同 汇总模式下忽略: %s", result['name'], names[subdir]['name'], result['file'])
+            continue
+        names[subdir] = result
+    #重名工程的输出可能覆盖了先转换的工程 重新暂存保留的工程
+    for result in names.values():
+        output.merge(result['outputs'])
+    with tracer.span('render CMakeLists'):
+        cmake.CMake(None, cmake_Pro_file, output).CmakeAggregate([result['name'] for result in names.values()])
+
+def stage_compile_commands(output, results, cmake_Pro_file, merge=False):
+    """
+    将所有工程的条目合并为根目录下的 compile_commands.json
+
+    :param results: convert_project 的结果列表
+    :param merge: 只转换了部分工程 (--only) 时保留已有文件中其他源文件的条目
+                  本次转换的工程的条目替换到原来的位置 其他条目按生成时的格式写出 内容未改变时文件不变
+    """
+    commands = [result['commands'] for result in results if result['commands']]
+    if not commands:
+        return
+    file_path = Path(cmake_Pro_file)/"compile_commands.json"
+    if merge and file_path.is_file():
+        import json
+        try:
+            existing = json.loads(file_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            existing = []
+        #(源文件, 条目文本) 与 CMake.iterCompileCommands 使用相同的 json.dumps 参数
+        entries = [(entry.get('file'), json.dumps(entry, ensure_ascii=False))
+                   for entry in existing if isinstance(entry, dict)]
+        for block in commands:
+            files = {entry['file'] for entry in json.loads('[' + block + ']')}
+            #插入到该工程第一个旧条目的位置 没有旧条目时放在末尾
+            index = next((i for i, (file, _) in enumerate(entries) if file in files), len(entries))
+            entries = entries[:index] + [(None, block)] + [entry for entry in entries[index:] if entry[0] not in files]
+        commands = [text for _, text in entries]
+    output.stage(file_path, '[\n' + ',\n'.join(commands) + '\n]\n')
+
+def watch_projects(matched_files, results, args, cmake_Pro_file):
+    """
+    持续运行 某个 uvprojx 文件改变后只重新解析并生成该工程
+    其他工程不会重新处理 只写入内容改变的文件 按 Ctrl+C 退出
+
+    :param matched_files: 要监视的 uvprojx 文件列表
+    :param results: 首次转换的结果 保存在内存中 用于合并 compile_commands.json
+    """
+    results = {Path(result['file']): result for result in results}
+    watcher = watch.ProjectWatcher(matched_files, args.watch_interval)
+    log.info("正在监视 %d 个工程 按 Ctrl+C 退出", len(matched_files))
+    try:
+        while True:
+            changed = watcher.wait()
+            output = OutputStage()
+            for file in changed:
+                log.info("工程已修改: %s", file)
+                result = convert_project(file, args, cmake_Pro_file)
+                if result['error']:
+                    log.error("❌ 工程转换失败: %s\n%s", result['file'], result['error'])
+                    continue
+                results[Path(file)] = result
+                output.merge(result['outputs'])
+            if not output.items():
+                continue
+            if args.aggregate:
+                if not args.only:
+                    stage_aggregate(output, results.values(), cmake_Pro_file)
+            else:
+                stage_rule_files(output, cmake_Pro_file)
+            stage_compile_commands(output, results.values(), cmake_Pro_file, merge=bool(args.only))
+            output.commit()
+            output.summary()
+    except KeyboardInterrupt:
+        pass
+
 if __name__ == '__main__':
+    args = parse_arguments()
+    setup_logging(args.log_level)
+    tracer.enable(args.timings or args.trace is not None)
     current_dir = os.getcwd()
     current_file = os.path.basename(__file__)
     parent_dir = Path(__file__).parent.parent.absolute()
-    matched_files = get_files_by_extensions(parent_dir, ['uvprojx'])
+    if args.only:
+        #只转换指定的工程 (生成的 .cmake 在 uvprojx 改变后调用) 不需要搜索目录
+        matched_files = [Path(file).absolute() for file in args.only]
+    else:
+        with tracer.span('discovery'):
+            matched_files = get_files_by_extensions(parent_dir, ['uvprojx'], DEFAULT_EXCLUDES + tuple(args.exclude), args.max_depth)
     #print(matched_files)
     """设置CMAKE放置的位置 默认位置为 项目父目录下新建 cmake文件夹中
     """
     cmake_Pro_file = parent_dir
+    #建立器件启动文件和链接脚本的索引 每个工程只需要查表
+    if args.device_pack and matched_files:
+        import devicepack
+        with tracer.span('device pack index'):
+            #不放在 cmake/.cache 中 避免被当作解析缓存的条目淘汰
+            cache_file = None if args.no_cache else parent_dir/"cmake"/".cache"/"index"/"devicepack.pickle"
+            args.device_index = devicepack.DevicePackIndex([parent_dir] + args.pack_root, cache_file,
+                                                           DEFAULT_EXCLUDES + tuple(args.exclude)).refresh()
     """循环处理 并提取不同项目的 信息
     """
+    results = convert_projects(matched_files, args, cmake_Pro_file)
+    failed = [result for result in results if result['error']]
+    for result in failed:
+        log.error("❌ 工程转换失败: %s\n%s", result['file'], result['error'])
+    log.info("转换完成: 成功 %d 个, 失败 %d 个", len(results) - len(failed), len(failed))
 
-    for file in matched_files:
-        file_path = str(file.parent)
-        file_name = file.name
-        parser = argparse.ArgumentParser(description='This is a demo script', add_help=True)
-        parser.add_argument('--parent_dir', nargs='?', default=file_path,help="Root directory of project")
-        args = parser.parse_args()
-        #print(args)
-	    #"--ewp", help="Search for *.EWP file in project structure", action='store_true')
-        #parser.add_argument("--uvprojx", help="Search for *.UPROJX file in project structure", action='store_true')
-        project= UVPROJXProject(args, file)
-        project.parseProject()
-        CmakeFile = cmake.CMake(project.getProject(), cmake_Pro_file)
-        CmakeFile.AnalyseCmake()
-        CmakeFile.populateCMake()
-    cmake_path = parent_dir/"cmake"
-    cmake_path = Path(cmake_path)
-    cmake_rule_path =  Path(cmake_path/'Rule.cmake')
-    if cmake_rule_path.exists():
-        os.remove(cmake_rule_path)
-
-    cmake_dir = get_files_by_extensions(cmake_path, ['.cmake'])
-    cmake_lenth = len(cmake_dir)
-    print(cmake_dir,cmake_lenth)
-    for cmake_file in cmake_dir:
-        if cmake_lenth == 1:
-            print("该项目只有一个工程 自动复制该编译配置 并进行编译")
-            print(cmake_rule_path)
-            copy_file_with_custom_name(cmake_file, cmake_rule_path)
-            projectName = Path(cmake_file).stem
-            
-
-    CmakeFile.CmakeCopyList(projectName)
+    #所有输出先暂存 最后只写入内容改变的文件
+    output = OutputStage()
+    for result in results:
+        output.merge(result['outputs'])
+    #只转换部分工程时 汇总的 CMakeLists.txt 仍然包含其他工程 不重新生成
+    if args.aggregate:
+        if not args.only:
+            stage_aggregate(output, results, cmake_Pro_file)
+    else:
+        stage_rule_files(output, cmake_Pro_file)
+    stage_compile_commands(output, results, cmake_Pro_file, merge=bool(args.only))
 
-    
+    with tracer.span('commit'):
+        output.commit()
+    output.summary()
 
+    if args.timings:
+        tracer.summary()
+    if args.trace:
+        tracer.write(args.trace)
 
+    if args.watch:
+        watch_projects(matched_files, results, args, cmake_Pro_file)
+    elif failed:
+        sys.exit(1)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+""" 直接生成 build.ninja 的后端
+    不经过 CMake 配置 由解析后的工程直接写出 arm-none-eabi 的编译和链接规则
+    编译选项与生成的 .cmake 相同 依赖关系由 gcc 生成的 depfile 提供 (deps = gcc)
+    生成规则带有 restat 重新生成后内容未改变时 ninja 不会重新编译
+    在项目根目录下运行: ninja -f cmake/<name>.ninja
+    @file
+"""
+
+import io
+import re
+import sys
+import shutil
+from pathlib import Path, PurePath
+from cmake import CMake, cmake_identifier
+
+#ninja 文件中路径需要转义的字符
+NINJA_PATH_RE = re.compile(r'([$ :\n])')
+#命令行参数中需要加引号的字符 (包括 sh 会展开的通配符)
+SHELL_SPECIAL = set(' \t"\'()<>&|;*?[')
+#参与编译的源文件后缀 以及使用的编译器变量
+COMPILE_RULES = {'.c': 'cc', '.cpp': 'cxx', '.s': 'asm', '.S': 'asm'}
+
+def ninja_path(path):
+    """
+    转义 build 语句中的路径 ($ 空格 冒号)
+    """
+    return NINJA_PATH_RE.sub(r'$\1', path)
+
+def object_name(src):
+    """
+    源文件对应的目标文件名 (相对于目标文件目录) 项目外的绝对路径放在 _abs 目录下
+    """
+    path = PurePath(src)
+    if path.anchor:
+        return '/'.join(('_abs',) + tuple(part.replace(':', '') for part in path.parts[1:])) + '.o'
+    return path.as_posix() + '.o'
+
+def shell_arg(arg):
+    """
+    为命令行参数加上双引号 (参数包含空格 引号等字符时) 并转义 ninja 的 $
+    """
+    if any(c in SHELL_SPECIAL for c in arg):
+        arg = '"' + arg.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return arg.replace('$', '$$')
+
+class Ninja(CMake):
+    """ Backend writing build.ninja directly from the parsed project
+    """
+
+    def populateNinja (self):
+        """ Generate cmake/<name>.ninja using the analysis done by AnalyseCmake
+        """
+        self.core = self.coreFlag()
+        self.generateFile()
+
+    def manifestPath (self):
+        return Path(self.path)/"cmake"/(self.project.name + ".ninja")
+
+    def regenCommand (self):
+        """
+        重新生成 build.ninja 的命令 只重新转换本工程 只包含影响生成结果的选项
+        """
+        command = [self.converterPath(), '--only', self.uvprojxPath()] + self.regenArgs()
+        if '--ninja' not in command:
+            command.append('--ninja')
+        return '$python ' + ' '.join(shell_arg(arg) for arg in command)
+
+    def planBuild (self):
+        """
+        规划每个 Target 的目标文件和可执行文件
+        编译设置 (内核 宏定义 头文件路径) 相同的 Target 使用同一个目标文件目录 相同的源文件只编译一次
+
+        Returns:
+            tuple: (configs, targets)
+                configs: [{'id', 'flags', 'defs', 'incs'}, ...]
+                targets: [{'id', 'config', 'srcs'}, ...]
+        """
+        paths = self.project.paths
+        configs = {}
+        targets = []
+        used_ids = set()
+        single = len(self.project.targets) == 1
+        #器件启动文件 每个可执行文件都需要
+        startup = [self.localPath(self.Cmake['CMAKE_SRC_INIT'])] if self.Cmake.get('CMAKE_SRC_INIT') else []
+        for target in self.project.targets:
+            #只有一个 Target 时 可执行文件与 CMake 一样使用工程名
+            target_id = self.project.name if single else cmake_identifier(target.name)
+            while target_id in used_ids:
+                target_id += '_'
+            used_ids.add(target_id)
+
+            incs = self.includePaths(target)
+            signature = (target.ads_cpu_type, tuple(target.defs), tuple(incs), tuple(self.optimizeFlags(target)))
+            if signature not in configs:
+                configs[signature] = {
+                    'id': cmake_identifier(target_id),
+                    'flags': self.compileFlags(target) + self.optimizeFlags(target),
+                    'defs': target.defs,
+                    'incs': [paths.cmakePath(inc) for inc in incs],
+                }
+            srcs = [paths.cmakePath(file) for file in dict.fromkeys(target.srcs)]
+            targets.append({
+                'id': target_id,
+                'config': configs[signature]['id'],
+                'srcs': [src for src in srcs if Path(src).suffix in COMPILE_RULES] + startup,
+            })
+        return list(configs.values()), targets
+
+    def iterNinja (self):
+        """
+        逐段产出 build.ninja 的内容
+        """
+        configs, targets = self.planBuild()
+        builddir = 'build/ninja/' + cmake_identifier(self.project.name)
+        manifest = Path(self.manifestPath()).relative_to(self.path).as_posix()
+        uvprojx = self.uvprojxPath()
+
+        yield '# Generated from ' + uvprojx + ', do not edit\n'
+        yield '# Run from the project root: ninja -f ' + manifest + '\n'
+        yield 'ninja_required_version = 1.3\n'
+        yield 'builddir = ' + builddir + '\n'
+        #使用运行本工具的解释器 很多系统上没有名为 python 的命令
+        yield 'python = ' + shell_arg(sys.executable) + '\n'
+        #生成时找到的编译缓存 (只写程序名 不写本机路径)
+        yield 'launcher = ' + next((name for name in ('ccache', 'sccache') if shutil.which(name)), '') + '\n'
+        yield 'cc = arm-none-eabi-gcc\n'
+        yield 'cxx = arm-none-eabi-g++\n'
+        yield 'ldflags = ' + ' '.join(shell_arg(flag) for flag in self.linkFlags()) + '\n'
+
+        yield '\nrule cc\n'
+        yield '  command = $launcher $cc -MMD -MF $out.d $cflags $defines $includes -c $in -o $out\n'
+        yield '  depfile = $out.d\n  deps = gcc\n  description = CC $out\n'
+        yield '\nrule cxx\n'
+        yield '  command = $launcher $cxx -MMD -MF $out.d $cflags $defines $includes -c $in -o $out\n'
+        yield '  depfile = $out.d\n  deps = gcc\n  description = CXX $out\n'
+        yield '\nrule asm\n'
+        yield '  command = $launcher $cc -x assembler-with-cpp -MMD -MF $out.d $cflags $defines $includes -c $in -o $out\n'
+        yield '  depfile = $out.d\n  deps = gcc\n  description = AS $out\n'
+        yield '\nrule link\n'
+        yield '  command = $cc $cflags $ldflags $in -o $out\n  description = LINK $out\n'
+        #uvprojx 改变后重新生成 内容未改变时 restat 使依赖它的目标不会重新编译
+        yield '\nrule regen\n'
+        yield '  command = ' + self.regenCommand() + '\n'
+        yield '  description = Regenerating ' + manifest + '\n  generator = 1\n  restat = 1\n'
+        yield '\nbuild ' + ninja_path(manifest) + ': regen ' + ninja_path(uvprojx) + '\n'
+
+        for config in configs:
+            name = config['id']
+            yield '\n' + name + '_cflags = ' + ' '.join(shell_arg(flag) for flag in config['flags']) + '\n'
+            yield name + '_defines = ' + ' '.join(shell_arg('-D' + define) for define in config['defs']) + '\n'
+            yield name + '_includes = ' + ' '.join(shell_arg('-I' + inc) for inc in config['incs']) + '\n'
+
+        outputs = []
+        compiled = set()
+        for target in targets:
+            config = target['config']
+            objects = []
+            for src in target['srcs']:
+                obj = '$builddir/' + config + '/' + ninja_path(object_name(src))
+                objects.append(obj)
+                if obj in compiled:
+                    continue
+                compiled.add(obj)
+                yield '\nbuild ' + obj + ': ' + COMPILE_RULES[Path(src).suffix] + ' ' + ninja_path(src) + '\n'
+                yield '  cflags = $' + config + '_cflags\n'
+                yield '  defines = $' + config + '_defines\n'
+                yield '  includes = $' + config + '_includes\n'
+            elf = 'release/' + target['id'] + '.elf'
+            outputs.append(ninja_path(elf))
+            yield '\nbuild ' + ninja_path(elf) + ': link ' + ' '.join(objects) + '\n'
+            yield '  cflags = $' + config + '_cflags\n'
+
+        yield '\nbuild all: phony ' + ' '.join(outputs) + '\n'
+        yield 'default all\n'
+
+    def writeNinja (self, stream):
+        """
+        将 build.ninja 的内容直接写入文件或缓冲区
+        """
+        write = stream.write
+        for chunk in self.iterNinja():
+            write(chunk)
+
+    def generateFile (self):
+        buffer = io.StringIO()
+        self.writeNinja(buffer)
+        self.output.stage(self.manifestPath(), buffer.getvalue())
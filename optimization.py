@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+""" Keil 编译优化设置到 GCC 选项的转换
+    Optim       优化等级 ARMCC 5: 0=<default>(-O2) 1..4=-O0..-O3
+                         ARMCC 6: 0=<default>(-O0) 1..4=-O0..-O3 5=-Ofast 6=-Os(balanced) 7=-Oz
+    oTime       ARMCC 5 的 Optimize for Time 未勾选时 armcc 使用 -Ospace 以代码大小优先
+                对应 GCC 的 -Os (只对 -O2 及以上) 勾选时保持优化等级
+    OneElfS     每个函数一个 ELF 段 生成的编译选项总是包含 -ffunction-sections/-fdata-sections
+                armlink 默认删除未使用的段 因此链接时总是使用 --gc-sections (见 cmake.LINK_FLAGS)
+    uLtcg/v6Lto ARMCC 5 的跨模块优化 / ARMCC 6 的链接时优化 对应 -flto
+    SplitLS     拆分 LDM/STM 以降低中断延迟 GCC 没有对应的选项 忽略
+    @file
+"""
+
+#CMake 的编译类型
+BUILD_TYPES = ('Debug', 'Release', 'RelWithDebInfo', 'MinSizeRel')
+#Optim -> GCC 优化等级 GCC 12 之前没有 -Oz 使用 -Os
+AC5_LEVELS = {0: '-O2', 1: '-O0', 2: '-O1', 3: '-O2', 4: '-O3'}
+AC6_LEVELS = {0: '-O0', 1: '-O0', 2: '-O1', 3: '-O2', 4: '-O3', 5: '-Ofast', 6: '-Os', 7: '-Os'}
+
+def optimize_level(options):
+    """
+    返回 Keil 优化设置对应的 GCC 优化等级 如 -O2
+
+    Args:
+        options: Target.options 或分组/文件的优化设置
+    """
+    optim = options.get('Optim', 0)
+    if options.get('uAC6', 0):
+        return AC6_LEVELS.get(optim, '-O0')
+    level = AC5_LEVELS.get(optim, '-O2')
+    if not options.get('oTime', 0) and level in ('-O2', '-O3'):
+        return '-Os'
+    return level
+
+def lto_enabled(options, mode='auto'):
+    """
+    是否使用链接时优化
+
+    Args:
+        options: Target.options
+        mode: auto 跟随 Keil 的设置 on/off 强制开启/关闭 (--lto)
+    """
+    if mode == 'on':
+        return True
+    if mode == 'off':
+        return False
+    return bool(options.get('v6Lto', 0) if options.get('uAC6', 0) else options.get('uLtcg', 0))
+
+def build_type_flags(options, mode='auto'):
+    """
+    返回每种编译类型的编译选项和链接选项
+
+    Returns:
+        dict: build_type -> (compile_flags, link_flags) 均为字符串
+    """
+    level = optimize_level(options)
+    lto = ' -flto' if lto_enabled(options, mode) else ''
+    return {
+        'Debug': ('-Og -g', ''),
+        'Release': (level + lto, (level + lto) if lto else ''),
+        'RelWithDebInfo': (level + ' -g' + lto, (level + lto) if lto else ''),
+        'MinSizeRel': ('-Os' + lto, ('-Os' + lto) if lto else ''),
+    }
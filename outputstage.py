@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+""" 生成文件的暂存与提交
+    所有输出先暂存在内存中 提交时与磁盘上已有的内容比较
+    只有内容改变的文件才会写入 写入时先写同目录的临时文件 再原子替换
+    内容未改变的文件保持原来的修改时间 CMake 不会因此重新配置
+    @file
+"""
+
+import os
+import logging
+from pathlib import Path
+from tracing import tracer
+
+log = logging.getLogger(__name__)
+
+#新建文件使用的权限 遵循当前进程的 umask
+_umask = os.umask(0)
+os.umask(_umask)
+NEW_FILE_MODE = 0o666 & ~_umask
+
+def read_bytes(file_path):
+    """
+    读取文件内容 文件不存在时返回 None
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            return file.read()
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+
+def write_atomic(file_path, data):
+    """
+    原子写入文件: 写入同目录下的临时文件后用 os.replace 替换
+    同目录保证替换不会变成跨文件系统的复制
+
+    Args:
+        file_path: 目标文件路径
+        data: 要写入的字节
+    """
+    #延迟导入 没有文件需要写入时不需要加载
+    import tempfile
+    target = Path(file_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=target.parent, prefix='.' + target.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        try:
+            mode = os.stat(target).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = NEW_FILE_MODE
+        os.chmod(temp_name, mode)
+        os.replace(temp_name, target)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+        raise
+
+def read_pickle(file_path, default=None):
+    """
+    读取 pickle 格式的缓存文件 文件不存在或无法读取时返回 default
+    """
+    import pickle
+    try:
+        with open(file_path, 'rb') as file:
+            return pickle.load(file)
+    except Exception:
+        return default
+
+def write_pickle(file_path, obj):
+    """
+    以 pickle 格式原子写入缓存文件 (见 write_atomic) 失败时抛出异常
+    """
+    import pickle
+    write_atomic(file_path, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+class OutputStage(object):
+    """ In-memory staging area for generated files
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.written = []
+        self.unchanged = []
+
+    def stage(self, file_path, content, encoding='utf-8'):
+        """ Stage content (str or bytes) for file_path, replacing earlier staged content
+        """
+        if isinstance(content, str):
+            content = content.encode(encoding)
+        self.files[str(Path(file_path))] = content
+
+    def staged(self, file_path):
+        """ Return staged bytes for file_path or None
+        """
+        return self.files.get(str(Path(file_path)))
+
+    def items(self):
+        """ Return staged (path, bytes) pairs in staging order
+        """
+        return list(self.files.items())
+
+    def merge(self, items):
+        """ Stage (path, bytes) pairs produced by another stage, e.g. in a worker process
+        """
+        for file_path, content in items:
+            self.stage(file_path, content)
+
+    def commit(self):
+        """ Write staged files whose content differs from disk
+        @return Tuple of written and unchanged file lists
+        """
+        written_bytes = 0
+        for file_path, content in self.files.items():
+            if read_bytes(file_path) == content:
+                self.unchanged.append(file_path)
+            else:
+                write_atomic(file_path, content)
+                self.written.append(file_path)
+                written_bytes += len(content)
+        self.files = {}
+        tracer.counter('output', bytes_written=written_bytes, files_written=len(self.written))
+        return self.written, self.unchanged
+
+    def summary(self):
+        """ Print summary of the last commit
+        """
+        for file_path in self.written:
+            log.debug("✓ 已写入: %s", file_path)
+        log.info("输出文件: 写入 %d 个, 未改变 %d 个", len(self.written), len(self.unchanged))
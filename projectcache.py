@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+""" uvprojx 解析结果的磁盘缓存
+    缓存以 uvprojx 文件内容的哈希和解析器版本作为键 保存 UVPROJXProject.getProject() 的结果
+    文件未改变时可以直接读取缓存 不需要再加载 lxml 解析XML
+    缓存总大小超过上限时 按最近使用时间淘汰最旧的条目
+    @file
+"""
+
+import os
+import hashlib
+import logging
+import pickle
+import tempfile
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+#缓存默认大小上限 64MB
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+CACHE_SUFFIX = '.pickle'
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """
+    计算文件内容的 sha256
+
+    Args:
+        file_path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ProjectCache(object):
+    """ On-disk cache of parsed uvprojx projects
+    """
+
+    def __init__(self, cache_dir, version, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.version = version
+        self.max_bytes = max_bytes
+
+    def key(self, xmlFile):
+        """ Return cache key for the current content of xmlFile
+        """
+        return hashlib.sha256((self.version + ':' + hash_file(xmlFile)).encode('utf-8')).hexdigest()
+
+    def entryPath(self, key):
+        return self.cache_dir / (key + CACHE_SUFFIX)
+
+    def load(self, key):
+        """ Load cached project for key
+        @return Project dictionary or None when the entry is missing or unreadable
+        """
+        entry = self.entryPath(key)
+        try:
+            with open(entry, 'rb') as file:
+                project = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning("缓存读取失败 忽略该条目: %s (%s)", entry, e)
+            self.remove(entry)
+            return None
+        #更新访问时间 淘汰时按最近使用排序
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return project
+
+    def store(self, key, project):
+        """ Store parsed project under key, then evict old entries
+        """
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            #先写入同目录的临时文件 再原子替换 多进程同时写入时不会读到半个文件
+            fd, temp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(project, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_name, self.entryPath(key))
+        except Exception as e:
+            log.warning("缓存写入失败: %s", e)
+            if 'temp_name' in locals():
+                self.remove(temp_name)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """ Remove least recently used entries until the cache fits in max_bytes
+        """
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(CACHE_SUFFIX):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
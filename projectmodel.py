@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+""" 解析后的工程数据模型
+    使用 __slots__ 的类保存工程数据 不再混用 lxml 元素 Path 列表和字符串
+    所有路径保存在一个去重的路径表中 只标准化一次 Target 和分组中只保存路径表的序号
+    模型只包含基本类型 可以直接 pickle 用于磁盘缓存或在进程池中传递
+    @file
+"""
+
+import posixpath
+
+def normalize_path(raw):
+    """
+    标准化 Keil 工程中的路径: 统一使用 '/' 分隔 去除多余的 '/' 和 '.'
+    与 pathlib 的规则相同 不会折叠 '..'
+
+    Args:
+        raw (str): uvprojx 中的原始路径
+
+    Returns:
+        str: 标准化后的路径
+    """
+    path = raw.replace('\\', '/')
+    anchor = ''
+    if len(path) >= 2 and path[1] == ':':
+        anchor, path = path[:2], path[2:]
+    if path.startswith('/'):
+        anchor += '/'
+    parts = [part for part in path.split('/') if part and part != '.']
+    return (anchor + '/'.join(parts)) or '.'
+
+def strip_parent_parts(path):
+    """
+    去除标准化路径开头的所有 "../" 得到 .cmake 中相对于工程根目录的路径
+    与 cmake.process_relative_path 的结果相同
+
+    Args:
+        path (str): normalize_path 返回的路径
+
+    Returns:
+        str: 处理后的路径
+    """
+    parts = path.split('/')
+    i = 0
+    while i < len(parts) and parts[i] == '..':
+        i += 1
+    if i == len(parts):
+        return '.'
+    return '/'.join(parts[i:])
+
+class PathTable(object):
+    """ Deduplicated table of normalized project paths
+    """
+    __slots__ = ('paths', 'cmake', 'index')
+
+    def __init__(self):
+        self.paths = []
+        self.cmake = []
+        self.index = {}
+
+    def intern(self, raw):
+        """ Return index of raw path, adding it to the table on first use
+        """
+        i = self.index.get(raw)
+        if i is None:
+            path = normalize_path(raw)
+            i = self.index.get(path)
+            if i is None:
+                i = len(self.paths)
+                self.paths.append(path)
+                self.cmake.append(strip_parent_parts(path))
+                self.index[path] = i
+            self.index[raw] = i
+        return i
+
+    def path(self, i):
+        """ Return normalized path stored at index i
+        """
+        return self.paths[i]
+
+    def cmakePath(self, i):
+        """ Return path stored at index i relative to the CMake source directory
+        """
+        return self.cmake[i]
+
+    def rebase(self, base):
+        """ Recompute CMake paths relative to the project root instead of stripping leading "../"
+        base 为 uvprojx 所在目录相对于项目根目录的路径 (如 proj2/MDK-ARM)
+        返回位于项目根目录之外的路径数量 这些路径以 "../" 开头
+        """
+        outside = 0
+        for i, path in enumerate(self.paths):
+            if path.startswith('/') or path[1:2] == ':':
+                continue
+            path = posixpath.normpath(posixpath.join(base, path))
+            if path == '..' or path.startswith('../'):
+                outside += 1
+            self.cmake[i] = path
+        return outside
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getstate__(self):
+        #index 可以由 paths 重建 不写入缓存
+        return (self.paths, self.cmake)
+
+    def __setstate__(self, state):
+        self.paths, self.cmake = state
+        self.index = {path: i for i, path in enumerate(self.paths)}
+
+class Override(object):
+    """ Compiler settings a Keil group or file overrides (GroupOption/FileOption)
+    """
+    __slots__ = ('options', 'defs', 'undefs', 'incs')
+
+    def __init__(self):
+        #只包含明确设置的优化选项 (Optim oTime) 未设置的继承上一级
+        self.options = {}
+        #在上一级的基础上增加/取消的宏定义 以及增加的头文件路径 (路径表序号)
+        self.defs = []
+        self.undefs = []
+        self.incs = []
+
+    def __bool__(self):
+        return bool(self.options or self.defs or self.undefs or self.incs)
+
+class Group(object):
+    """ Keil source group: name and indexes of its files in the path table
+    """
+    __slots__ = ('name', 'files', 'override', 'file_overrides')
+
+    def __init__(self, name, files=None):
+        self.name = name
+        self.files = files if files is not None else []
+        #分组的设置 (Override 或 None) 以及单个文件的设置 {路径表序号: Override}
+        self.override = None
+        self.file_overrides = {}
+
+class Target(object):
+    """ Settings of one Keil target
+    """
+    __slots__ = ('name', 'chip', 'vendor', 'cpu', 'ads_cpu_type', 'incs', 'defs', 'groups', 'options')
+
+    def __init__(self, name, chip='', vendor='', cpu='', ads_cpu_type=''):
+        self.name = name
+        self.chip = chip
+        self.vendor = vendor
+        self.cpu = cpu
+        self.ads_cpu_type = ads_cpu_type
+        #incs 为路径表序号 defs 为宏定义字符串
+        self.incs = []
+        self.defs = []
+        self.groups = []
+        #Keil 的编译优化设置 如 {'Optim': 4, 'oTime': 0, 'uAC6': 0} 见 optimization.py
+        self.options = {}
+
+    @property
+    def srcs(self):
+        """ Indexes of all source files in group order
+        """
+        return [i for group in self.groups for i in group.files]
+
+class Project(object):
+    """ Parsed uvprojx project: path table and all targets
+    """
+    __slots__ = ('paths', 'targets', 'uvprojx')
+
+    def __init__(self, uvprojx=''):
+        self.paths = PathTable()
+        self.targets = []
+        self.uvprojx = uvprojx
+
+    @property
+    def name(self):
+        """ Name of the first target, used as the project name
+        """
+        return self.targets[0].name
+
+    @property
+    def main(self):
+        """ First target, used for the single-target settings
+        """
+        return self.targets[0]
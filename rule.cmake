@@ -0,0 +1,4 @@
+#自动生成 选择 CMakeLists.txt 编译的工程
+set(Pro_Rule_File ${CMAKE_CURRENT_LIST_DIR}/{{cmake_file}})
+set_property(DIRECTORY APPEND PROPERTY CMAKE_CONFIGURE_DEPENDS ${Pro_Rule_File})
+include(${Pro_Rule_File})
@@ -0,0 +1,7 @@
+#自动生成 汇总模式下工程 {{project_name}} 的子目录 由顶层 CMakeLists.txt 通过 add_subdirectory 加入
+#工程设置 (源文件 头文件路径 宏定义 编译选项) 只在本目录中生效 路径以顶层设置的 PRO_ROOT 为根
+include(${CMAKE_CURRENT_LIST_DIR}/{{project_name}}.cmake)
+
+project(${CMAKE_PROJECT_NAME} C ASM)
+
+{{targets}}
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+""" 生成用于性能测试的 uvprojx 工程
+    按指定数量生成分组 源文件 头文件路径 宏定义和 Target 结构与 Keil 生成的文件相同
+    可以同时在磁盘上创建对应的源文件和头文件 用于测试目录搜索和 #include 扫描
+    @file
+"""
+
+import os
+import argparse
+from pathlib import Path
+
+def write_uvprojx(file_path, name='Synth', groups=10, files=100, incs=20, defines=10, targets=1):
+    """
+    写出一个合成的 uvprojx 文件 逐行写入 不在内存中拼接整个文件
+
+    Args:
+        file_path: 输出的 uvprojx 路径
+        name: 第一个 Target 的名称 其余 Target 为 name_1, name_2 ...
+        groups: 每个 Target 的分组数量
+        files: 每个分组的源文件数量
+        incs: 头文件路径数量
+        defines: 宏定义数量
+        targets: Target 数量 所有 Target 共用相同的源文件 只有宏定义不同
+    """
+    include_path = ';'.join(f'../Inc/inc{i}' for i in range(incs))
+    define_list = [f'SYNTH_DEFINE_{i}' for i in range(defines)]
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8') as out:
+        write = out.write
+        write('<?xml version="1.0" encoding="UTF-8" standalone="no" ?>\n')
+        write('<Project xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="project_projx.xsd">\n')
+        write('  <SchemaVersion>2.1</SchemaVersion>\n  <Header>### uVision Project, (C) Keil Software</Header>\n  <Targets>\n')
+        for t in range(targets):
+            target_name = name if t == 0 else f'{name}_{t}'
+            target_defines = ','.join(define_list + ([f'SYNTH_TARGET_{t}'] if t else []))
+            write(f'    <Target>\n      <TargetName>{target_name}</TargetName>\n')
+            write('      <ToolsetNumber>0x4</ToolsetNumber>\n      <ToolsetName>ARM-ADS</ToolsetName>\n')
+            write('      <TargetOption>\n        <TargetCommonOption>\n')
+            write('          <Device>STM32F407VGTx</Device>\n          <Vendor>STMicroelectronics</Vendor>\n')
+            write('          <Cpu>IRAM(0x20000000,0x00020000) IROM(0x08000000,0x00100000) CPUTYPE("Cortex-M4") FPU2 CLOCK(12000000) ELITTLE</Cpu>\n')
+            write('        </TargetCommonOption>\n        <TargetArmAds>\n')
+            write('          <ArmAdsMisc>\n            <AdsCpuType>"Cortex-M4"</AdsCpuType>\n          </ArmAdsMisc>\n')
+            write('          <Cads>\n            <Optim>3</Optim>\n            <OneElfS>1</OneElfS>\n            <VariousControls>\n')
+            write('              <MiscControls></MiscControls>\n')
+            write(f'              <Define>{target_defines}</Define>\n')
+            write('              <Undefine></Undefine>\n')
+            write(f'              <IncludePath>{include_path}</IncludePath>\n')
+            write('            </VariousControls>\n          </Cads>\n        </TargetArmAds>\n      </TargetOption>\n')
+            write('      <Groups>\n')
+            for g in range(groups):
+                write(f'        <Group>\n          <GroupName>Group{g}</GroupName>\n          <Files>\n')
+                for f in range(files):
+                    write(f'            <File>\n              <FileName>src{g}_{f}.c</FileName>\n'
+                          f'              <FileType>1</FileType>\n'
+                          f'              <FilePath>../Src/group{g}/src{g}_{f}.c</FilePath>\n            </File>\n')
+                write('          </Files>\n        </Group>\n')
+            write('      </Groups>\n    </Target>\n')
+        write('  </Targets>\n</Project>\n')
+    return file_path
+
+def create_tree(root, name='Synth', groups=10, files=100, incs=20, defines=10, targets=1, sources=True):
+    """
+    在 root 下创建完整的合成工程: MDK-ARM/<name>.uvprojx 以及可选的源文件和头文件
+    同时创建 Keil 的 Objects/Listings 中间目录 用于测试目录搜索时的剪枝
+
+    Returns:
+        Path: 生成的 uvprojx 文件路径
+    """
+    root = Path(root)
+    uvprojx = write_uvprojx(root/'MDK-ARM'/(name + '.uvprojx'), name, groups, files, incs, defines, targets)
+    for junk in ('Objects', 'Listings'):
+        junk_dir = root/'MDK-ARM'/junk
+        junk_dir.mkdir(parents=True, exist_ok=True)
+        for f in range(files):
+            (junk_dir/f'src{f}.o').write_bytes(b'')
+    if sources:
+        for i in range(incs):
+            inc_dir = root/'Inc'/f'inc{i}'
+            inc_dir.mkdir(parents=True, exist_ok=True)
+            (inc_dir/f'header{i}.h').write_text(f'#include "header{(i + 1) % incs}.h"\n' if i + 1 < incs else '')
+        for g in range(groups):
+            group_dir = root/'Src'/f'group{g}'
+            group_dir.mkdir(parents=True, exist_ok=True)
+            for f in range(files):
+                (group_dir/f'src{g}_{f}.c').write_text(f'#include "header{g % max(incs, 1)}.h"\n' if incs else '')
+    return uvprojx
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic uvprojx project for benchmarks', add_help=True)
+    parser.add_argument('root', help="Directory the synthetic project is created in")
+    parser.add_argument('--name', default='Synth', help="Name of the first target")
+    parser.add_argument('--groups', type=int, default=10, help="Number of source groups per target")
+    parser.add_argument('--files', type=int, default=100, help="Number of sources per group")
+    parser.add_argument('--incs', type=int, default=20, help="Number of include paths")
+    parser.add_argument('--defines', type=int, default=10, help="Number of defines")
+    parser.add_argument('--targets', type=int, default=1, help="Number of targets")
+    parser.add_argument('--no-sources', action='store_true', help="Only write the uvprojx file")
+    args = parser.parse_args()
+    uvprojx = create_tree(args.root, args.name, args.groups, args.files, args.incs, args.defines,
+                          args.targets, not args.no_sources)
+    print(f"已生成: {uvprojx} ({os.path.getsize(uvprojx)} 字节)")
@@ -0,0 +1,51 @@
+#编译成果物路径
+set(OUTPUT_PAHT ${OutPut_Path})
+set(EXECUTABLE_OUTPUT_PATH ${OUTPUT_PAHT})
+set(CMAKE_EXE_LINKER_FLAGS ${LINKER_FLAGS})
+
+if(DEFINED Pro_Targets)
+    #工程包含多个 Target: 编译设置相同的 Target 共用的源文件编译为 OBJECT 库 只编译一次
+    #--group-libs 时每个 Keil 分组编译为一个 OBJECT 库 使用分组自己的编译设置
+    foreach(PRO_LIB ${Pro_Common_Libs})
+        add_library(${PRO_LIB} OBJECT ${SRC_${PRO_LIB}})
+        target_include_directories(${PRO_LIB} PRIVATE ${Inc_${PRO_LIB}})
+        target_compile_definitions(${PRO_LIB} PRIVATE ${Def_${PRO_LIB}})
+        target_compile_options(${PRO_LIB} PRIVATE ${Opt_${PRO_LIB}})
+    endforeach()
+    #每个 Target 生成一个可执行文件 并链接共享的 OBJECT 库
+    foreach(PRO_TARGET ${Pro_Targets})
+        add_executable(${PRO_TARGET} ${SRC_Pro_${PRO_TARGET}} ${CMAKE_SRC_INIT})
+        target_include_directories(${PRO_TARGET} PRIVATE ${Inc_Pro_${PRO_TARGET}})
+        target_compile_definitions(${PRO_TARGET} PRIVATE ${Def_Pro_${PRO_TARGET}})
+        target_compile_options(${PRO_TARGET} PRIVATE ${Opt_Pro_${PRO_TARGET}})
+        target_link_libraries(${PRO_TARGET} PRIVATE ${Lib_Pro_${PRO_TARGET}})
+        #强制输出的成果物为 .elf
+        set_target_properties(${PRO_TARGET} PROPERTIES SUFFIX ".elf")
+    endforeach()
+else()
+    #需要编译的.c文件
+    SET(SRC_LIST
+        ${SRC_Pro}   
+        ${CMAKE_SRC_INIT}
+    )
+
+    #编译时的头文件
+    include_directories(${Inc_Pro})
+    add_executable(${CMAKE_PROJECT_NAME} ${SRC_LIST})
+    #强制输出的成果物为 .elf
+    set_target_properties(${PROJECT_NAME} PROPERTIES SUFFIX ".elf")
+endif()
+
+if(Pro_Unity)
+    #合并编译: 按 .cmake 中设置的 UNITY_GROUP (Keil 分组) 合并源文件
+    get_property(PRO_BUILD_TARGETS DIRECTORY PROPERTY BUILDSYSTEM_TARGETS)
+    set_target_properties(${PRO_BUILD_TARGETS} PROPERTIES UNITY_BUILD ON UNITY_BUILD_MODE GROUP)
+endif()
+
+if(PCH_Pro)
+    #预编译被大多数源文件包含的头文件
+    get_property(PRO_BUILD_TARGETS DIRECTORY PROPERTY BUILDSYSTEM_TARGETS)
+    foreach(PRO_BUILD_TARGET ${PRO_BUILD_TARGETS})
+        target_precompile_headers(${PRO_BUILD_TARGET} PRIVATE ${PCH_Pro})
+    endforeach()
+endif()
@@ -2,68 +2,167 @@
 
 """ 解析UVPROJX项目格式文件的类
     需要将该工程放到项目目录的最外层的 ProjectToCMAKE 目录下运行
-    该类使用lxml库进行XML解析，因此需要确保环境中已安装lxml库。
+    使用 iterparse 流式解析XML 解析后端可以是 lxml 或标准库的 xml.etree.ElementTree (C 实现)
+    两者得到的工程数据相同 后端在第一次解析时才导入 命中缓存或没有工程时不需要加载
     该库的目的是解析MKD的UVPROJX项目文件，并提取项目的相关设置，如项目名称、芯片型号、包含路径、宏定义和源文件列表。
     @file
 """
 
 import os
-from lxml import objectify
-from pathlib import Path
+import sys
+from projectmodel import Project, Target, Group, Override
+from tracing import tracer
+
+#解析器版本 解析结果的格式发生变化时需要更新 用于使磁盘缓存失效
+__version__ = '2.2.1'
+
+#需要从 Target 中提取的元素 key 为相对于 <Target> 的标签路径
+TARGET_FIELDS = {
+    ('TargetName',): 'TargetName',
+    ('TargetOption', 'TargetCommonOption', 'Device'): 'Device',
+    ('TargetOption', 'TargetCommonOption', 'Vendor'): 'Vendor',
+    ('TargetOption', 'TargetCommonOption', 'Cpu'): 'Cpu',
+    ('TargetOption', 'TargetArmAds', 'ArmAdsMisc', 'AdsCpuType'): 'AdsCpuType',
+    ('TargetOption', 'TargetArmAds', 'Cads', 'VariousControls', 'IncludePath'): 'IncludePath',
+    ('TargetOption', 'TargetArmAds', 'Cads', 'VariousControls', 'Define'): 'Define',
+    ('uAC6',): 'uAC6',
+    ('TargetOption', 'TargetArmAds', 'ArmAdsMisc', 'uLtcg'): 'uLtcg',
+    ('TargetOption', 'TargetArmAds', 'Cads', 'Optim'): 'Optim',
+    ('TargetOption', 'TargetArmAds', 'Cads', 'oTime'): 'oTime',
+    ('TargetOption', 'TargetArmAds', 'Cads', 'SplitLS'): 'SplitLS',
+    ('TargetOption', 'TargetArmAds', 'Cads', 'OneElfS'): 'OneElfS',
+    ('TargetOption', 'TargetArmAds', 'Cads', 'v6Lto'): 'v6Lto',
+}
+#编译优化相关的设置 (整数)
+OPTION_FIELDS = ('uAC6', 'uLtcg', 'Optim', 'oTime', 'SplitLS', 'OneElfS', 'v6Lto')
+#分组和文件可以覆盖的编译设置 key 为相对于 <Cads> 的标签路径
+OVERRIDE_FIELDS = {
+    ('Optim',): 'Optim',
+    ('oTime',): 'oTime',
+    ('VariousControls', 'Define'): 'Define',
+    ('VariousControls', 'Undefine'): 'Undefine',
+    ('VariousControls', 'IncludePath'): 'IncludePath',
+}
+GROUP_OPTION_PATH = ('Groups', 'Group', 'GroupOption', 'GroupArmAds', 'Cads')
+FILE_OPTION_PATH = ('Groups', 'Group', 'Files', 'File', 'FileOption', 'FileArmAds', 'Cads')
+GROUP_OPTION_FIELDS = {GROUP_OPTION_PATH + key: name for key, name in OVERRIDE_FIELDS.items()}
+FILE_OPTION_FIELDS = {FILE_OPTION_PATH + key: name for key, name in OVERRIDE_FIELDS.items()}
+#分组/文件设置中表示继承上一级的值 Optim: <default>  oTime 等复选框: 灰色
+INHERIT_VALUES = {'Optim': 0, 'oTime': 2}
+#可用的 XML 解析后端 auto 优先使用 lxml 未安装时使用标准库
+XML_BACKENDS = ('auto', 'lxml', 'etree')
+GROUP_PATH = ('Groups', 'Group')
+GROUP_NAME = ('Groups', 'Group', 'GroupName')
+FILE_PATH = ('Groups', 'Group', 'Files', 'File', 'FilePath')
+TARGET_PATH = ('Project', 'Targets', 'Target')
+
+def load_backend(name='auto'):
+    """
+    导入 XML 解析后端 返回其 iterparse
+
+    Args:
+        name: XML_BACKENDS 之一 auto 时 lxml 不可用则使用标准库
+
+    Returns:
+        tuple: (实际使用的后端名称, iterparse)
+    """
+    if name not in XML_BACKENDS:
+        raise ValueError(f"未知的 XML 解析后端: {name}")
+    if name in ('auto', 'lxml'):
+        try:
+            from lxml import etree
+            return 'lxml', etree.iterparse
+        except ImportError:
+            if name == 'lxml':
+                raise
+    from xml.etree import ElementTree
+    return 'etree', ElementTree.iterparse
+
+def iter_targets(xmlFile, backend='auto'):
+    """
+    使用 iterparse 流式读取 uvprojx 文件 逐个产出 Target 的设置
+    只保留需要的元素文本 已处理完的元素会立即清除 内存占用不随文件大小增长
+
+    Args:
+        xmlFile: uvprojx 文件路径
+        backend: XML 解析后端 见 load_backend
+
+    Returns:
+        生成器 每个 Target 产出一个 dict 包含 TARGET_FIELDS 中的字段
+        以及 Groups 列表 (每个分组为 {'GroupName', 'FilePath', 'Option', 'FileOption'}
+        Option 为分组的 OVERRIDE_FIELDS 设置 FileOption 为 {文件在 FilePath 中的序号: 设置})
+    """
+    #延迟导入 命中缓存时不需要加载解析库
+    backend, iterparse = load_backend(backend)
+
+    depth = len(TARGET_PATH)
+    path = []
+    #标准库的元素没有 getparent 需要记录从根元素到当前元素的元素列表
+    elems = [] if backend == 'etree' else None
+    target = None
+    for event, elem in iterparse(str(xmlFile), events=('start', 'end')):
+        if event == 'start':
+            path.append(elem.tag)
+            if elems is not None:
+                elems.append(elem)
+            if tuple(path) == TARGET_PATH:
+                target = {'Groups': []}
+            elif target is not None and tuple(path[depth:]) == GROUP_PATH:
+                target['Groups'].append({'GroupName': '', 'FilePath': [], 'Option': {}, 'FileOption': {}})
+            continue
+
+        if target is not None and len(path) > depth:
+            key = tuple(path[depth:])
+            if key == FILE_PATH:
+                target['Groups'][-1]['FilePath'].append(elem.text or '')
+            elif key == GROUP_NAME:
+                target['Groups'][-1]['GroupName'] = elem.text or ''
+            elif key in GROUP_OPTION_FIELDS:
+                target['Groups'][-1]['Option'][GROUP_OPTION_FIELDS[key]] = elem.text or ''
+            elif key in FILE_OPTION_FIELDS:
+                #<FileOption> 在同一个 <File> 的 <FilePath> 之后
+                group = target['Groups'][-1]
+                group['FileOption'].setdefault(len(group['FilePath']) - 1, {})[FILE_OPTION_FIELDS[key]] = elem.text or ''
+            elif key in TARGET_FIELDS:
+                target[TARGET_FIELDS[key]] = elem.text or ''
+        if target is not None and len(path) == depth:
+            yield target
+            target = None
+        path.pop()
+
+        #释放已经处理完的元素 以及之前的兄弟节点
+        elem.clear()
+        if elems is None:
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        else:
+            #之前的兄弟元素都已删除 它位于父元素的开头 remove 不需要遍历
+            elems.pop()
+            if elems:
+                elems[-1].remove(elem)
 
 class UVPROJXProject(object):
     """ Class for converting UVPROJX project format file
     """
 
-    def __init__(self, path, xmlFile):
+    def __init__(self, path, xmlFile, backend='auto'):
         self.path = path
-        self.project = {}
+        self.project = None
         self.xmlFile = xmlFile
-        xmltree = objectify.parse(xmlFile)
-        self.root = xmltree.getroot()
+        self.backend = backend
 
 
     def parseProject(self):
         """ Parses EWP project file for project settings
         """
 
-
-
-        self.project['name'] = self.root.Targets.Target.TargetName
-        self.project['chip'] = str(self.root.Targets.Target.TargetOption.TargetCommonOption.Device)
-        self.project['Vendor'] = str(self.root.Targets.Target.TargetOption.TargetCommonOption.Vendor)
-        self.project['FlashUtilSpec'] = str(self.root.Targets.Target.TargetOption.TargetCommonOption.Cpu)
-        self.project['AdsCpuType'] = self.root.Targets.Target.TargetOption.TargetArmAds.ArmAdsMisc.AdsCpuType.text
-        #self.project['Define']=str(self.root.Targets.Target.TargetOption.TargetArmAds.VariousControls.Define)
-        self.project['incs'] = self.root.Targets.Target.TargetOption.TargetArmAds.Cads.VariousControls.IncludePath.text.split(';')
-        self.project['mems'] = self.root.Targets.Target.TargetOption.TargetCommonOption.Cpu
-        self.project['defs'] = self.root.Targets.Target.TargetOption.TargetArmAds.Cads.VariousControls.Define.text.split(',')
-        #print(self.project['FlashUtilSpec'])
-        #print(self.project['AdsCpuType'],self.project['defs'] )
-        #print(self.project['incs'])
-        self.project['srcs'] = []
-
-        #print(self.project['name'],self.project['chip'],self.project['Vendor'],self.project['FlashUtilSpec'])
-
-        for element in self.root.Targets.Target.Groups.getchildren():
-            #print('GroupName: ' + element.GroupName.text)
-            if hasattr(element, 'Files'):
-                for file in element.Files.getchildren():
-                    if not str(file.FilePath.text).endswith('.s'):
-                        s = str(file.FilePath.text)
-                        src_file=Path(s)
-                        #print(src_file)
-                        #使用标准化的路径 
-                        self.project['srcs'].append(src_file)
-
-        for i in range(0, len(self.project['incs'])):
-            s = str(self.project['incs'][i])
-            src_file=Path(s)
-            #print(src_file)
-            self.project['incs'][i] = src_file
-
-        self.project['files'] = []
-        i = 0
+        #解析所有 Target 所有路径放入同一个路径表 不同 Target 共用的文件只保存一份
+        self.project = Project(str(self.xmlFile))
+        for target in iter_targets(self.xmlFile, self.backend):
+            with tracer.span('normalize paths'):
+                self.project.targets.append(self.parseTarget(target))
+        if not self.project.targets:
+            raise ValueError(f"工程中没有 Target: {self.xmlFile}")
 
         """增加在不同编译器下 需要增加的启动文件
         """
@@ -74,19 +173,67 @@ class UVPROJXProject(object):
                     self.project['files'].append(self.path + '/Drivers/CMSIS/Device/ST/STM32F3xx/Source/Templates/gcc/'+ entry)
         """
 
+    def parseTarget(self, target):
+        """ Convert settings of one Target read by iter_targets to a projectmodel.Target
+        """
+        paths = self.project.paths
+        result = Target(target['TargetName'], target['Device'], target['Vendor'],
+                        target['Cpu'], target['AdsCpuType'])
+        for key in OPTION_FIELDS:
+            value = target.get(key, '').strip()
+            if value.isdigit():
+                result.options[key] = int(value)
+        if target['IncludePath']:
+            result.incs = [paths.intern(inc) for inc in target['IncludePath'].split(';')]
+        if target['Define'].strip():
+            #Keil 允许 "A, B" 这样的写法 去掉空白和空项 与 CMake 看到的宏定义一致
+            result.defs = [sys.intern(define.strip()) for define in target['Define'].split(',') if define.strip()]
+
+        #保留 Keil 的分组结构 合并编译 (unity build) 按分组进行 启动文件 .s 不加入
+        for group in target['Groups']:
+            files = [paths.intern(s) for s in group['FilePath'] if not s.endswith('.s')]
+            result_group = Group(sys.intern(group['GroupName']), files)
+            result_group.override = self.parseOverride(group['Option'])
+            for index, option in group['FileOption'].items():
+                file_path = group['FilePath'][index]
+                override = self.parseOverride(option)
+                if override is not None and not file_path.endswith('.s'):
+                    result_group.file_overrides[paths.intern(file_path)] = override
+            result.groups.append(result_group)
+        return result
+
+    def parseOverride(self, option):
+        """ Convert GroupOption/FileOption settings read by iter_targets to a projectmodel.Override
+        @return Override, or None when everything is inherited
+        """
+        override = Override()
+        for key, inherit in INHERIT_VALUES.items():
+            value = option.get(key, '').strip()
+            if value.isdigit() and int(value) != inherit:
+                override.options[key] = int(value)
+        if option.get('Define', '').strip():
+            override.defs = [sys.intern(define.strip()) for define in option['Define'].split(',') if define.strip()]
+        if option.get('Undefine', '').strip():
+            override.undefs = [sys.intern(define.strip()) for define in option['Undefine'].split(',') if define.strip()]
+        if option.get('IncludePath', '').strip():
+            override.incs = [self.project.paths.intern(inc) for inc in option['IncludePath'].split(';') if inc.strip()]
+        return override if override else None
+
     def displaySummary(self):
         """ Display summary of parsed project settings
         """
-        print('Project Name:' + self.project['name'])
-        print('Project chip:' + self.project['chip'])
-        print('Project includes: ' + ' '.join(self.project['incs']))
-        print('Project defines: ' + ' '.join(self.project['defs']))
-        print('Project srcs: ' + ' '.join(self.project['srcs']))
-        print('Project: ' + self.project['mems'])
+        target = self.project.main
+        paths = self.project.paths
+        print('Project Name:' + target.name)
+        print('Project chip:' + target.chip)
+        print('Project includes: ' + ' '.join(paths.path(i) for i in target.incs))
+        print('Project defines: ' + ' '.join(target.defs))
+        print('Project srcs: ' + ' '.join(paths.path(i) for i in target.srcs))
+        print('Project: ' + target.cpu)
 
     def getProject(self):
-        """ Return parsed project settings stored as dictionary
-        @return Dictionary containing project settings
+        """ Return parsed project settings
+        @return projectmodel.Project containing project settings
         """
         return self.project
 
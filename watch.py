@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+""" 监视 uvprojx 文件的变化
+    在 uVision 中修改工程 同时使用 GCC 编译时 只重新生成被修改的工程
+    使用轮询比较文件的修改时间和大小 不依赖 inotify 等平台相关的接口
+    @file
+"""
+
+import os
+import time
+from pathlib import Path
+
+#默认轮询间隔 (秒)
+DEFAULT_INTERVAL = 1.0
+
+def file_signature(file_path):
+    """ 返回 (mtime_ns, size) 文件不存在时返回 None
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+class ProjectWatcher(object):
+    """ Poll a set of files and report the ones that changed
+    """
+
+    def __init__(self, files, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        #已处理的状态 以及上一次轮询看到的状态
+        self.known = {Path(file): file_signature(file) for file in files}
+        self.seen = dict(self.known)
+
+    def poll(self):
+        """ Check every file once
+        @return List of files changed since they were last reported. A file is only reported
+                once two consecutive polls see the same state, so a save in progress is not read
+        """
+        changed = []
+        for file in self.known:
+            signature = file_signature(file)
+            if signature != self.seen[file]:
+                self.seen[file] = signature
+                continue
+            if signature != self.known[file] and signature is not None:
+                self.known[file] = signature
+                changed.append(file)
+        return changed
+
+    def wait(self):
+        """ Block until at least one file changed
+        @return List of changed files
+        """
+        while True:
+            time.sleep(self.interval)
+            changed = self.poll()
+            if changed:
+                return changed